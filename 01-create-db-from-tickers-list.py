@@ -1,36 +1,139 @@
-import sqlite3
+import datetime
+import db
+import instrumentation
 import pandas as pd
+from migrations import migrate
 
 # Local file paths
 NASDAQ_FILE = "data/nasdaqlisted.txt"
 NYSE_FILE = "data/otherlisted.txt"
 DB_FILE = "data/tickers.db"
 
+# Columns of us_tickers that come from the listing files
+LISTING_COLUMNS = [
+    "Symbol", "Security Name", "Exchange", "Market Category",
+    "Test Issue", "Financial Status", "ETF", "exclude_reason"
+]
+
+# Pre-filter, first matching rule wins. Excluded symbols keep their row in
+# us_tickers with an `exclude_reason`, and are never enriched. NYSE symbols
+# carry the security type as a suffix ($ preferred, .U unit, .W warrant,
+# .R right), NASDAQ ones only in the name.
+EXCLUDE_RULES = [
+    ("test issue", lambda df: df["Test Issue"] == "Y"),
+    ("etf", lambda df: df["ETF"] == "Y"),
+    ("preferred", lambda df: df["Symbol"].str.contains("$", regex=False) | (
+        df["Security Name"].str.contains(r"\bPreferred\s+(?:Stock|Shares?|Units|Securities|Class)\b", case=False)
+        # ADRs/ADSs backed by preferred shares trade like common equity (ITUB, ELP)
+        & ~df["Security Name"].str.contains(r"\bADR\b|\bADS\b|American Depositary Share", case=False)
+    )),
+    ("unit", lambda df: df["Symbol"].str.endswith(".U") | (
+        # Not the common units of a partnership (PAA, ARLP...): they are its shares
+        _name_suffix(df, "units?") & ~df["Security Name"].str.contains("Limited Partner", case=False)
+    )),
+    ("warrant", lambda df: df["Symbol"].str.contains(".W", regex=False) | _name_suffix(df, "warrants?")),
+    ("right", lambda df: df["Symbol"].str.endswith(".R") | _name_suffix(df, "rights?")),
+]
+
+def _name_suffix(df, word):
+    # NASDAQ names: "<issuer> - <security type>", e.g. "Ainos, Inc. - warrants"
+    return df["Security Name"].str.contains(rf"\s-\s.*\b{word}\b", case=False)
+
+def exclude_reasons(df):
+    # Reason of the first matching rule for each row, None when kept
+    reasons = pd.Series(None, index=df.index, dtype=object)
+    for reason, rule in EXCLUDE_RULES:
+        match = rule(df).fillna(False).astype(bool) & reasons.isna()
+        reasons[match] = reason
+    return reasons
+
 def process_files(nasdaq_file, nyse_file):
     # Read NASDAQ file
-    nasdaq_df = pd.read_csv(nasdaq_file, sep="|")
+    # keep_default_na=False: "NA" (Nano Labs) is a symbol, not a missing value
+    nasdaq_df = pd.read_csv(nasdaq_file, sep="|", keep_default_na=False, na_values=[""])
     nasdaq_df = nasdaq_df[:-1]  # Remove footer
     nasdaq_df["Exchange"] = "NASDAQ"
 
     # Read NYSE/Other file
-    nyse_df = pd.read_csv(nyse_file, sep="|")
+    nyse_df = pd.read_csv(nyse_file, sep="|", keep_default_na=False, na_values=[""])
     nyse_df = nyse_df[:-1]  # Remove footer
     nyse_df["Exchange"] = nyse_df["Exchange"].map({"N": "NYSE", "A": "AMEX", "P": "NYSE ARCA"})
 
-    # Normalize columns and concatenate
+    # Normalize columns and concatenate: Market Category and Financial
+    # Status only exist for NASDAQ
     nyse_df = nyse_df.rename(columns={"ACT Symbol": "Symbol"})
+    columns = [c for c in LISTING_COLUMNS if c != "exclude_reason"]
     combined_df = pd.concat([
-        nasdaq_df[["Symbol", "Security Name", "Exchange"]],
-        nyse_df[["Symbol", "Security Name", "Exchange"]]
+        nasdaq_df.reindex(columns=columns),
+        nyse_df.reindex(columns=columns)
     ], ignore_index=True)
 
+    combined_df["exclude_reason"] = exclude_reasons(combined_df)
     return combined_df
 
+def diff_listings(df, stored):
+    """
+    Params:
+        df     : listings, one row per symbol, LISTING_COLUMNS
+        stored : dict symbol -> (listing values..., delisted_at) of us_tickers
+
+    Returns:
+        (new, changed, delisted) — rows to insert, listing rows to update
+        (values changed, or listed again), symbols gone from the files
+    """
+    listed = {row[0]: row for row in df[LISTING_COLUMNS].itertuples(index=False, name=None)}
+    new = [row for symbol, row in listed.items() if symbol not in stored]
+    changed = [
+        row for symbol, row in listed.items()
+        if symbol in stored and (stored[symbol][:-1] != row[1:] or stored[symbol][-1] is not None)
+    ]
+    delisted = [symbol for symbol, values in stored.items() if symbol not in listed and values[-1] is None]
+    return new, changed, delisted
+
 def store_in_database(df, db_file):
-    with sqlite3.connect(db_file) as conn:
-        df.to_sql("us_tickers", conn, if_exists="replace", index=False)
-        print(f"Stored {len(df)} tickers in {db_file}.")
+    """
+    Applies the listings of `df` to us_tickers as a diff: new symbols are
+    inserted (to be enriched by step 02), symbols gone from the files are
+    marked with `delisted_at`, the others keep their `processed` state.
+    """
+    df = df.astype(object).where(df.notna(), None).drop_duplicates(subset="Symbol", keep="last")
+    today = datetime.date.today().isoformat()
+    columns = ", ".join(f'"{c}"' for c in LISTING_COLUMNS)
+    conn = db.connect(db_file)
+    try:
+        migrate(conn)
+        stored = {
+            row[0]: row[1:]
+            for row in conn.execute(f"SELECT {columns}, delisted_at FROM us_tickers")
+        }
+        new, changed, delisted = diff_listings(df, stored)
+
+        placeholders = ", ".join("?" for _ in LISTING_COLUMNS)
+        updates = ", ".join(f'"{c}" = ?' for c in LISTING_COLUMNS[1:])
+        with db.transaction(conn):
+            conn.executemany(
+                f"INSERT INTO us_tickers ({columns}, listed_at, processed) VALUES ({placeholders}, ?, 0)",
+                [(*row, today) for row in new]
+            )
+            conn.executemany(
+                f'UPDATE us_tickers SET {updates}, delisted_at = NULL WHERE "Symbol" = ?',
+                [(*row[1:], row[0]) for row in changed]
+            )
+            conn.executemany(
+                'UPDATE us_tickers SET delisted_at = ? WHERE "Symbol" = ?',
+                [(today, symbol) for symbol in delisted]
+            )
+        print(f"Stored {len(df)} tickers in {db_file}: {len(new)} new, {len(delisted)} delisted, {len(changed)} updated.")
+        excluded = df["exclude_reason"].value_counts()
+        if not excluded.empty:
+            print(f"Excluded from enrichment: {excluded.sum()} ({', '.join(f'{n} {r}' for r, n in excluded.items())})")
+        return {"new": len(new), "updated": len(changed), "delisted": len(delisted)}
+    finally:
+        conn.close()
 
 if __name__ == "__main__":
-    tickers_df = process_files(NASDAQ_FILE, NYSE_FILE)
-    store_in_database(tickers_df, DB_FILE)
+    with instrumentation.run(__file__):
+        with instrumentation.stage("process_files"):
+            tickers_df = process_files(NASDAQ_FILE, NYSE_FILE)
+        with instrumentation.stage("store_in_database"):
+            store_in_database(tickers_df, DB_FILE)
@@ -1,20 +1,39 @@
-import sqlite3
-import yfinance as yf
+import db
+import instrumentation
+import numpy as np
 import pandas as pd
 import time
 import datetime
-import yfinance as yf
+from fetch_pool import run_pool
+from market_data import get_provider
+from migrations import migrate
 
 DB_PATH = "data/tickers.db"
 CANDIDATES_DB_PATH = "data/candidates.db"
 SOURCE_TABLE = "us_tickers"
 TARGET_TABLE = "ticker_info"
-SLEEP_TIME = 1  # Delay to avoid Yahoo Finance rate limits
+REQUESTS_PER_SECOND = 2  # HTTP requests per second, to avoid Yahoo Finance rate limits
+FULL_REQUESTS = 2  # Requests per symbol of the full fetch: info + options
+INFO_REQUESTS = 1  # Phase 1 of the two-phase mode: info only
+OPTIONS_REQUESTS = 1  # Phase 2: options only
+FULL_INFO_MIN_CAP = 10_000_000_000  # Market cap from which the options are fetched (two-phase mode)
+
+# Re-enrichment of already processed tickers, run after each enrichment
+DAILY_REFRESH_BUDGET = 500  # Tickers refreshed per run, i.e. per day when run nightly
+MIN_REFRESH_AGE_DAYS = 1  # Rows fetched more recently are never refreshed
+SCREEN_THRESHOLDS = [100_000_000_000, FULL_INFO_MIN_CAP]  # Caps where a stale value changes the outcome
+CLOSENESS_SCALE = 0.1  # Distance (decades of market cap) at which closeness halves the priority
+CONCURRENCY = 4  # Requests in flight at once
+MAX_RETRIES = 3  # Per-symbol retries, with exponential backoff
+BATCH_SIZE = 50  # Enriched rows written per transaction...
+BATCH_SECONDS = 30  # ...or every BATCH_SECONDS, whichever comes first
 
 FIELDS = [
     "symbol", "longName", "sector", "industry", "country",
     "marketCap", "currency", "isOptionable", "quoteType", "exchange"
 ]
+INFO_FIELDS = [f for f in FIELDS if f != "isOptionable"]
+OPTIONS_FIELDS = ["symbol", "isOptionable"]
 
 SECTOR_ETF_MAP = {
     "Technology": "XLK",
@@ -30,172 +49,230 @@ SECTOR_ETF_MAP = {
     "Communication Services": "XLC"
 }
 
-def get_or_fetch_return(symbol, period, conn):
-    today = datetime.date.today().isoformat()
-    cur = conn.cursor()
 
-    # Step 1: check cache
-    cur.execute("""
-        SELECT return_pct FROM price_cache
-        WHERE symbol = ? AND period = ? AND last_updated = ?
-    """, (symbol, period, today))
-    row = cur.fetchone()
-    if row:
-        return row[0]
-
-    # Step 2: fetch from yfinance
-    try:
-        hist = yf.Ticker(symbol).history(period=period)
-        if hist.empty or len(hist) < 2:
-            return None
-        ret = (hist["Close"].iloc[-1] - hist["Close"].iloc[0]) / hist["Close"].iloc[0]
-        return_pct = round(ret, 4)
-    except:
-        return None
-
-    # Step 3: insert into cache
-    cur.execute("""
-        INSERT OR REPLACE INTO price_cache (symbol, period, return_pct, last_updated)
-        VALUES (?, ?, ?, ?)
-    """, (symbol, period, return_pct, today))
-    conn.commit()
-    return return_pct
-
-def init_cache_table(conn):
-    conn.execute("""
-        CREATE TABLE IF NOT EXISTS price_cache (
-            symbol TEXT,
-            period TEXT,
-            return_pct REAL,
-            last_updated TEXT,
-            PRIMARY KEY (symbol, period, last_updated)
+def write_batch(conn, rows, fields=FIELDS, stamp="enriched_at"):
+    # Rows and their 'processed' flags land in the same transaction:
+    # a killed run never leaves a symbol flagged without its data.
+    # Only `fields` are written: a quote never erases a full info.
+    stamps = [stamp, "fetched_at"]
+    columns = ", ".join(fields + stamps)
+    placeholders = ", ".join("?" for _ in fields + stamps)
+    updates = ", ".join(f"{f} = excluded.{f}" for f in fields[1:] + stamps)
+    now = time.time()
+    with db.transaction(conn):
+        conn.executemany(
+            f"INSERT INTO {TARGET_TABLE} ({columns}) VALUES ({placeholders}) "
+            f"ON CONFLICT (symbol) DO UPDATE SET {updates}",
+            [tuple(row[f] for f in fields) + (now, now) for row in rows]
+        )
+        conn.executemany(
+            f"UPDATE {SOURCE_TABLE} SET processed = 1 WHERE Symbol = ?",
+            [(row["symbol"],) for row in rows]
         )
-    """)
-    conn.commit()
 
-def alter_ticker_info_for_dividends(db_path):
 
-    fields_to_add = {
-        "has_dividend": "BOOLEAN",
-        "next_dividend_date": "TEXT",
-        "days_until_dividend": "INTEGER"
+def fetch_ticker_info(ticker, provider=None):
+    # Errors propagate so that the pool can retry the symbol
+    provider = provider or get_provider()
+    row = fetch_ticker_info_only(ticker, provider)
+    # Fallback: check if options exist
+    row["isOptionable"] = bool(provider.options(ticker))
+    return row
+
+def fetch_ticker_info_only(ticker, provider=None):
+    # INFO_FIELDS, from the info request alone
+    provider = provider or get_provider()
+    info = provider.info(ticker)
+
+    return {
+        "symbol": ticker,
+        "longName": info.get("longName"),
+        "sector": info.get("sector"),
+        "industry": info.get("industry"),
+        "country": info.get("country"),
+        "marketCap": info.get("marketCap"),
+        "currency": info.get("currency"),
+        "quoteType": info.get("quoteType"),
+        "exchange": info.get("exchange")
     }
 
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-
-    # Get existing columns
-    cursor.execute("PRAGMA table_info(ticker_info)")
-    existing_cols = [row[1] for row in cursor.fetchall()]
-
-    for col, col_type in fields_to_add.items():
-        if col not in existing_cols:
-            print(f"Adding column '{col}' to ticker_info...")
-            cursor.execute(f"ALTER TABLE ticker_info ADD COLUMN {col} {col_type}")
-
-    conn.commit()
-    conn.close()
-    print("✅ Table 'ticker_info' updated with dividend fields.")
-
-def alter_ticker_info_add_last_check(db_path):
-    conn = sqlite3.connect(db_path)
-    cur = conn.cursor()
-    cur.execute("PRAGMA table_info(ticker_info)")
-    cols = [row[1] for row in cur.fetchall()]
-    if "last_dividend_check" not in cols:
-        cur.execute("ALTER TABLE ticker_info ADD COLUMN last_dividend_check TEXT")
-        conn.commit()
-        print("✅ Added column 'last_dividend_check'")
-    conn.close()
-
-def alter_price_cache_add_close_price(db_path):
-    import sqlite3
-    conn = sqlite3.connect(db_path)
-    cur = conn.cursor()
-    cur.execute("PRAGMA table_info(price_cache)")
-    cols = [row[1] for row in cur.fetchall()]
-    if "close_price" not in cols:
-        cur.execute("ALTER TABLE price_cache ADD COLUMN close_price REAL")
-        conn.commit()
-        print("✅ Added 'close_price' column to price_cache")
-    else:
-        print("ℹ️ 'close_price' already exists in price_cache")
-    conn.close()
-
-def fetch_ticker_info(ticker):
-    try:
-        yf_obj = yf.Ticker(ticker)
-        info = yf_obj.info
-        # Fallback: check if options exist
-        has_options = bool(yf_obj.options)
-
-        return {
-            "symbol": ticker,
-            "longName": info.get("longName"),
-            "sector": info.get("sector"),
-            "industry": info.get("industry"),
-            "country": info.get("country"),
-            "marketCap": info.get("marketCap"),
-            "currency": info.get("currency"),
-            "isOptionable": has_options,
-            "quoteType": info.get("quoteType"),
-            "exchange": info.get("exchange")
-        }
-    except Exception as e:
+def fetch_ticker_options(ticker, provider=None):
+    provider = provider or get_provider()
+    return {"symbol": ticker, "isOptionable": bool(provider.options(ticker))}
+
+def fetch_and_store(conn, tickers, fetch, fields=FIELDS, stamp="enriched_at",
+                    rate=REQUESTS_PER_SECOND, concurrency=CONCURRENCY, cost=FULL_REQUESTS):
+    """
+    Runs fetch(ticker) for all `tickers` on the worker pool and writes the
+    results in micro-batches. `cost` is the number of requests of one
+    fetch(ticker), spent from the `rate` budget. Returns the number of rows written.
+    """
+    if not tickers:
+        return 0
+    batch = []
+    last_flush = time.monotonic()
+    inserted = 0
+    done = 0
+
+    def flush():
+        nonlocal batch, last_flush, inserted
+        if batch:
+            write_batch(conn, batch, fields, stamp)
+            inserted += len(batch)
+            batch = []
+        last_flush = time.monotonic()
+
+    def maybe_flush():
+        if len(batch) >= BATCH_SIZE or time.monotonic() - last_flush >= BATCH_SECONDS:
+            flush()
+
+    def on_result(ticker, data):
+        nonlocal done
+        done += 1
+        print(f"[{done}/{len(tickers)}] Fetched {ticker}")
+        batch.append(data)
+        maybe_flush()
+
+    def on_failure(ticker, e):
+        nonlocal done
+        done += 1
         print(f"Error fetching {ticker}: {e}")
-        return None
-
-def enrich_tickers(db_path):
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-
-    # Ensure 'processed' column exists in SOURCE_TABLE
-    cursor.execute(f"PRAGMA table_info({SOURCE_TABLE})")
-    columns = [col[1] for col in cursor.fetchall()]
-    if 'processed' not in columns:
-        print("Adding 'processed' column to SOURCE_TABLE...")
-        cursor.execute(f"ALTER TABLE {SOURCE_TABLE} ADD COLUMN processed INTEGER DEFAULT 0")
-        conn.commit()
+        maybe_flush()
 
-    # Get unprocessed tickers
-    query = f"SELECT DISTINCT Symbol FROM {SOURCE_TABLE} WHERE processed IS NULL OR processed = 0"
-    tickers = pd.read_sql(query, conn)["Symbol"].tolist()
+    try:
+        stats = run_pool(
+            tickers,
+            fetch,
+            on_result=on_result,
+            on_failure=on_failure,
+            rate=rate,
+            concurrency=concurrency,
+            max_retries=MAX_RETRIES,
+            cost=cost,
+        )
+        print(f"Fetched {stats['ok']} tickers, {stats['failed']} failed, {stats['retried']} retries.")
+    finally:
+        # Also keep what was fetched when interrupted (Ctrl-C)
+        flush()
+        if inserted:
+            print(f"Inserted {inserted} new records into {TARGET_TABLE}.")
+        else:
+            print("No new data to insert.")
+    return inserted
+
+def unprocessed_tickers(conn):
+    query = f"SELECT DISTINCT Symbol FROM {SOURCE_TABLE} WHERE (processed IS NULL OR processed = 0) AND delisted_at IS NULL AND exclude_reason IS NULL"
+    return pd.read_sql(query, conn)["Symbol"].tolist()
+
+def large_unenriched_tickers(conn, min_cap=FULL_INFO_MIN_CAP):
+    # Symbols of phase 1 above `min_cap` still waiting for their options
+    query = f"""
+        SELECT symbol FROM {TARGET_TABLE}
+        WHERE enriched_at IS NULL AND marketCap >= ? AND (quoteType IS NULL OR quoteType = 'EQUITY')
+        ORDER BY marketCap DESC
+    """
+    return [row[0] for row in conn.execute(query, (min_cap,))]
+
+def enrich_tickers(db_path, rate=REQUESTS_PER_SECOND, concurrency=CONCURRENCY, provider=None,
+                   two_phase=True, min_cap=FULL_INFO_MIN_CAP):
+    """
+    Enriches the unprocessed tickers of us_tickers into ticker_info.
+
+    With `two_phase`, the info request alone runs on every unprocessed
+    ticker first, and the options request only on the equities whose
+    market cap is at least `min_cap`: N + L requests instead of 2N.
+    Without it, every ticker gets the full fetch.
+    """
+    conn = db.connect(db_path)
+    migrate(conn)
+    try:
+        tickers = unprocessed_tickers(conn)
+        if not two_phase:
+            if not tickers:
+                print("All tickers already processed. Nothing to do.")
+                return
+            fetch_and_store(conn, tickers, lambda t: fetch_ticker_info(t, provider=provider),
+                            rate=rate, concurrency=concurrency)
+            return
+
+        # Phase 1: info of the new tickers
+        if tickers:
+            print(f"Phase 1: info of {len(tickers)} tickers")
+            with instrumentation.stage("enrich: info"):
+                fetch_and_store(conn, tickers, lambda t: fetch_ticker_info_only(t, provider=provider),
+                                fields=INFO_FIELDS, stamp="quoted_at", rate=rate, concurrency=concurrency,
+                                cost=INFO_REQUESTS)
+
+        # Phase 2: options of the large ones, including those left by an interrupted run
+        large = large_unenriched_tickers(conn, min_cap)
+        if not tickers and not large:
+            print("All tickers already processed. Nothing to do.")
+            return
+        print(f"Phase 2: options of {len(large)} tickers with a market cap >= {min_cap:,.0f}")
+        with instrumentation.stage("enrich: options"):
+            fetch_and_store(conn, large, lambda t: fetch_ticker_options(t, provider=provider),
+                            fields=OPTIONS_FIELDS, rate=rate, concurrency=concurrency, cost=OPTIONS_REQUESTS)
+    finally:
+        conn.close()
 
-    if not tickers:
-        print("All tickers already processed. Nothing to do.")
+def refresh_priorities(conn, now=None, thresholds=SCREEN_THRESHOLDS, min_age_days=MIN_REFRESH_AGE_DAYS):
+    """
+    Listed, non-excluded tickers of ticker_info older than `min_age_days`,
+    most urgent first. The priority grows with the age of the row and with
+    the closeness of its market cap to a screening threshold:
+
+        priority = age_days / (CLOSENESS_SCALE + min |log10(marketCap / threshold)|)
+
+    so a 95B name is refreshed well before an equally stale 2T or 50M one.
+    """
+    now = time.time() if now is None else now
+    df = pd.read_sql(f"""
+        SELECT t.symbol, t.marketCap, t.fetched_at, t.enriched_at
+        FROM {TARGET_TABLE} t JOIN {SOURCE_TABLE} u ON u.Symbol = t.symbol
+        WHERE u.delisted_at IS NULL AND u.exclude_reason IS NULL
+          AND COALESCE(t.fetched_at, 0) < ?
+    """, conn, params=(now - min_age_days * 86400,))
+    age_days = (now - df["fetched_at"].fillna(0)) / 86400
+    with np.errstate(divide="ignore", invalid="ignore"):
+        log_cap = np.log10(df["marketCap"].where(df["marketCap"] > 0).to_numpy(dtype=float))
+        distance = np.min(np.abs(log_cap[:, None] - np.log10(np.asarray(thresholds, dtype=float))[None, :]), axis=1)
+    distance = np.where(np.isnan(distance), 1.0, distance)  # Unknown cap: as if a decade away
+    df["priority"] = age_days / (CLOSENESS_SCALE + distance)
+    return df.sort_values("priority", ascending=False).reset_index(drop=True)
+
+def refresh_stale_tickers(db_path, budget=DAILY_REFRESH_BUDGET, rate=REQUESTS_PER_SECOND,
+                          concurrency=CONCURRENCY, provider=None, min_cap=FULL_INFO_MIN_CAP):
+    """
+    Refreshes the `budget` most urgent rows of ticker_info (refresh_priorities):
+    the full fetch for rows above `min_cap` or already fully enriched, the
+    info alone for the others. Running it daily keeps ticker_info fresh at a bounded cost.
+    """
+    conn = db.connect(db_path)
+    migrate(conn)
+    try:
+        due = refresh_priorities(conn).head(budget)
+        if due.empty:
+            print("No stale ticker to refresh.")
+            return
+        full = due["enriched_at"].notna() | (due["marketCap"] >= min_cap)
+        print(f"Refreshing {len(due)} stale tickers: {full.sum()} full, {(~full).sum()} info only")
+        fetch_and_store(conn, due.loc[full, "symbol"].tolist(), lambda t: fetch_ticker_info(t, provider=provider),
+                        rate=rate, concurrency=concurrency)
+        fetch_and_store(conn, due.loc[~full, "symbol"].tolist(), lambda t: fetch_ticker_info_only(t, provider=provider),
+                        fields=INFO_FIELDS, stamp="quoted_at", rate=rate, concurrency=concurrency,
+                        cost=INFO_REQUESTS)
+    finally:
         conn.close()
-        return
-
-    enriched_data = []
-    for i, ticker in enumerate(tickers):
-        print(f"[{i+1}/{len(tickers)}] Fetching {ticker}...")
-        data = fetch_ticker_info(ticker)
-        if data:
-            enriched_data.append(data)
-            # Mark ticker as processed
-            cursor.execute(f"UPDATE {SOURCE_TABLE} SET processed = 1 WHERE Symbol = ?", (ticker,))
-            conn.commit()
-        time.sleep(SLEEP_TIME)  # Avoid throttling
-
-    if enriched_data:
-        df = pd.DataFrame(enriched_data, columns=FIELDS)
-        df.to_sql(TARGET_TABLE, conn, if_exists="append", index=False)
-        print(f"Inserted {len(df)} new records into {TARGET_TABLE}.")
-    else:
-        print("No new data to insert.")
-
-    conn.close()
 
 def UNUSED_update_dividend_info(symbol, conn, force=False):
     from datetime import date, timedelta
-    import yfinance as yf
     import pandas as pd
 
     today_str = date.today().isoformat()
 
     if not force:
         # Skip if already updated today
-        cursor = conn.execute("""
+        cursor = conn.execute(f"""
             SELECT last_dividend_check FROM {TARGET_TABLE} WHERE symbol = ?
         """, (symbol,))
         row = cursor.fetchone()
@@ -203,9 +280,9 @@ def UNUSED_update_dividend_info(symbol, conn, force=False):
             return  # Already updated
 
     try:
-        ticker = yf.Ticker(symbol)
-        cal = ticker.calendar
-        divs = ticker.dividends
+        provider = get_provider()
+        cal = provider.calendar(symbol)
+        divs = provider.dividends(symbol)
 
         has_dividend = not divs.empty
         next_div_date = None
@@ -226,7 +303,7 @@ def UNUSED_update_dividend_info(symbol, conn, force=False):
                 days_until = (ex_date - date.today()).days
 
         # Store in DB
-        conn.execute("""
+        conn.execute(f"""
             UPDATE {TARGET_TABLE}
             SET has_dividend = ?, next_dividend_date = ?, days_until_dividend = ?, last_dividend_check = ?
             WHERE symbol = ?
@@ -240,10 +317,12 @@ def UNUSED_update_dividend_info(symbol, conn, force=False):
 
 def main():
 
-    enrich_tickers(DB_PATH)
-    alter_ticker_info_for_dividends(DB_PATH)
-    alter_ticker_info_add_last_check(DB_PATH)
-    alter_price_cache_add_close_price(DB_PATH)
-    
+    with instrumentation.stage("refresh_stale_tickers"):
+        refresh_stale_tickers(DB_PATH)
+    # After the refresh: rows that crossed FULL_INFO_MIN_CAP get their options here
+    with instrumentation.stage("enrich_tickers"):
+        enrich_tickers(DB_PATH)
+
 if __name__ == "__main__":
-    main()
+    with instrumentation.run(__file__):
+        main()
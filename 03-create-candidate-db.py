@@ -1,9 +1,11 @@
-import sqlite3
-import yfinance as yf
+import db
+import instrumentation
 import pandas as pd
 import time
 import datetime
-import yfinance as yf
+from market_cache import init_cache_table, get_or_fetch_return, ensure_daily_bars, daily_closes
+from dividends import refresh_dividends
+from screening import period_return_table, screen_candidates
 
 DB_PATH = "data/tickers.db"
 CANDIDATES_DB_PATH = "data/candidates.db"
@@ -30,56 +32,18 @@ SECTOR_ETF_MAP = {
     "Communication Services": "XLC"
 }
 
-def get_or_fetch_return(symbol, period, conn):
-    today = datetime.date.today().isoformat()
-    cur = conn.cursor()
 
-    # Step 1: check cache
-    cur.execute("""
-        SELECT return_pct FROM price_cache
-        WHERE symbol = ? AND period = ? AND last_updated = ?
-    """, (symbol, period, today))
-    row = cur.fetchone()
-    if row:
-        return row[0]
-
-    # Step 2: fetch from yfinance
-    try:
-        hist = yf.Ticker(symbol).history(period=period)
-        if hist.empty or len(hist) < 2:
-            return None
-        ret = (hist["Close"].iloc[-1] - hist["Close"].iloc[0]) / hist["Close"].iloc[0]
-        return_pct = round(ret, 4)
-    except:
-        return None
-
-    # Step 3: insert into cache
-    cur.execute("""
-        INSERT OR REPLACE INTO price_cache (symbol, period, return_pct, last_updated)
-        VALUES (?, ?, ?, ?)
-    """, (symbol, period, return_pct, today))
-    conn.commit()
-    return return_pct
-
-def init_cache_table(conn):
-    conn.execute("""
-        CREATE TABLE IF NOT EXISTS price_cache (
-            symbol TEXT,
-            period TEXT,
-            return_pct REAL,
-            last_updated TEXT,
-            PRIMARY KEY (symbol, period, last_updated)
-        )
-    """)
-    conn.commit()
 
 def list_large_optionable_tickers(min_cap=10_000_000):
-    conn = sqlite3.connect(DB_PATH)
+    conn = db.connect(DB_PATH)
     try:
         query = f"""
             SELECT symbol, longName, marketCap, sector, industry, exchange
             FROM {TARGET_TABLE}
             WHERE marketCap > ? AND isOptionable = 1
+              AND symbol NOT IN (
+                  SELECT Symbol FROM {SOURCE_TABLE} WHERE delisted_at IS NOT NULL OR exclude_reason IS NOT NULL
+              )
             ORDER BY marketCap DESC
             LIMIT 200
         """
@@ -93,167 +57,103 @@ def list_large_optionable_tickers(min_cap=10_000_000):
         conn.close()
 
 def update_dividend_info(symbol, conn, force=False):
-    from datetime import date, timedelta
-    import yfinance as yf
-    import pandas as pd
-
-    today_str = date.today().isoformat()
-
-    if not force:
-        # Skip if already updated today
-        cursor = conn.execute(f"""
-            SELECT last_dividend_check FROM {TARGET_TABLE} WHERE symbol = ?
-        """, (symbol,))
-        row = cursor.fetchone()
-        if row and row[0] == today_str:
-            return  # Already updated
-
-    try:
-        ticker = yf.Ticker(symbol)
-        cal = ticker.calendar
-        divs = ticker.dividends
-
-        has_dividend = not divs.empty
-        next_div_date = None
-        days_until = None
-
-        # Try Yahoo ex-div date
-        ex_date = cal.get("Ex-Dividend Date")
-        if ex_date:
-            ex_date = pd.to_datetime(ex_date).date()
-            if ex_date >= date.today():
-                next_div_date = ex_date.isoformat()
-                days_until = (ex_date - date.today()).days
-        elif has_dividend:
-            last_date = divs.index[-1].date()
-            if len(divs) >= 4:
-                ex_date = last_date + timedelta(days=90)
-                next_div_date = ex_date.isoformat()
-                days_until = (ex_date - date.today()).days
-
-        # Store in DB
-        conn.execute("""
-            UPDATE {TARGET_TABLE}
-            SET has_dividend = ?, next_dividend_date = ?, days_until_dividend = ?, last_dividend_check = ?
-            WHERE symbol = ?
-        """, (has_dividend, next_div_date, days_until, today_str, symbol))
-        conn.commit()
-
-        print(f"💰 {symbol}: has_dividend={has_dividend}, next_div={next_div_date}, in {days_until}d")
-
-    except Exception as e:
-        print(f"❌ Dividend update failed for {symbol}: {e}")
-
-def check_outperformance_vs_sector_etf(ticker_list, period="1mo"):
-    import yfinance as yf
-    import sqlite3
+    # Single-symbol form of dividends.refresh_dividends()
+    refresh_dividends(conn, [symbol], force=force)
+
+def precompute_sector_etf_returns(periods, conn):
+    """
+    Returns of the 11 sector ETFs for every period, in one table:
+    columns sector, sector_etf and one column per period (None if unavailable).
+    """
+    rows = []
+    for sector, etf in SECTOR_ETF_MAP.items():
+        row = {"sector": sector, "sector_etf": etf}
+        for period in periods:
+            row[period] = get_or_fetch_return(etf, period, conn)
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+def build_screening_frame(ticker_list, periods, conn):
+    """
+    Everything the screen needs, one row per symbol: sector, marketCap,
+    dividend info, last price and the return (fraction) over each period,
+    all computed from the cached daily bars.
+    """
+    placeholders = ",".join("?" for _ in ticker_list)
+    info = pd.read_sql(f"""
+        SELECT symbol, sector, marketCap, has_dividend, days_until_dividend
+        FROM {TARGET_TABLE} WHERE symbol IN ({placeholders})
+    """, conn, params=list(ticker_list))
+    if info.empty:
+        return info
+
+    closes = daily_closes(info["symbol"].tolist())
+    returns = period_return_table(closes, periods).round(4)
+    prices = closes.ffill().iloc[-1].round(2) if not closes.empty else pd.Series(dtype=float)
+
+    frame = info.merge(returns, left_on="symbol", right_index=True, how="left")
+    frame["price"] = frame["symbol"].map(prices)
+    for symbol in frame.loc[frame["price"].isna(), "symbol"]:
+        print(f"⚠️ Failed to get last price for {symbol}")
+    return frame
+
+def check_outperformance_vs_sector_etf(ticker_list, period="1mo", max_price=120, min_market_cap=None):
     import pandas as pd
 
-    conn = sqlite3.connect(DB_PATH)
+    conn = db.connect(DB_PATH)
 
     init_cache_table(conn)
 
     try:
-        placeholders = ",".join("?" for _ in ticker_list)
-        query = f"SELECT symbol, sector FROM {TARGET_TABLE} WHERE symbol IN ({placeholders})"
-        ticker_sectors = pd.read_sql(query, conn, params=ticker_list)
-
-        if ticker_sectors.empty:
+        if not ticker_list:
             print("No ticker info found.")
             return pd.DataFrame()
 
-        results = []
-        price_cache = {}
-
-        def get_return(symbol):
-            if symbol in price_cache:
-                return price_cache[symbol]
-            try:
-                hist = yf.Ticker(symbol).history(period=period)
-                if hist.empty or len(hist) < 2:
-                    return None
-                ret = (hist["Close"].iloc[-1] - hist["Close"].iloc[0]) / hist["Close"].iloc[0]
-                price_cache[symbol] = ret
-                return ret
-            except:
-                return None
-
-        for idx, row in ticker_sectors.iterrows():
-            symbol = row["symbol"]
-            sector = row["sector"]
-            print(f"[{idx+1}/{len(ticker_sectors)}] {symbol}: sector={sector}")
-
-            # 1. Update dividend info
-            update_dividend_info(symbol, conn)
-            # Fetch updated dividend info
-            cursor = conn.execute("""
-                SELECT has_dividend, days_until_dividend
-                FROM ticker_info
-                WHERE symbol = ?
-            """, (symbol,))
-            div_row = cursor.fetchone()
-
-            has_dividend = div_row[0] if div_row else None
-            days_until = div_row[1] if div_row else None
+        # One incremental, batched download of the daily bars of every
+        # ticker and ETF: returns and prices below are computed from them
+        with instrumentation.stage("ensure_daily_bars"):
+            ensure_daily_bars(list(ticker_list) + list(SECTOR_ETF_MAP.values()))
 
-            # 2. Get ticker return
-            ticker_ret = get_or_fetch_return(symbol, period, conn)
-            if ticker_ret is None:
-                continue
-
-            # 3. Get sector ETF return
-            sector_etf = SECTOR_ETF_MAP.get(sector)
-            if not sector_etf:
-                print(f"⚠️ No ETF found for sector '{sector}'")
-                continue
-
-            etf_ret = get_or_fetch_return(sector_etf, period, conn)
-            if etf_ret is None:
-                continue
-
-            try:
-                price = yf.Ticker(symbol).history(period="1d")["Close"].iloc[-1]
-                if price > 120:
-                    print(f"⛔ {symbol} skipped (last price ${price:.2f} > 120)")
-                    continue
-            except:
-                print(f"⚠️ Failed to get last price for {symbol}")
-                continue
+        # Dividend info of the symbols not checked yet today, fetched concurrently
+        with instrumentation.stage("refresh_dividends"):
+            refresh_dividends(conn, ticker_list)
 
+        with instrumentation.stage("build_screening_frame"):
+            frame = build_screening_frame(ticker_list, [period], conn)
+        if frame.empty:
+            print("No ticker info found.")
+            return pd.DataFrame()
 
-            results.append({
-                "symbol": symbol,
-                "sector": sector,
-                "sector_etf": sector_etf,
-                "return_pct": round(ticker_ret * 100, 2),
-                "sector_etf_pct": round(etf_ret * 100, 2),
-                "outperforming": ticker_ret > etf_ret,
-                "has_dividend": has_dividend,
-                "days_until_dividend": days_until
-            })
+        # Sector ETF returns, resolved once for the whole scan
+        with instrumentation.stage("sector_etf_returns"), db.transaction(conn):
+            etf_returns = precompute_sector_etf_returns([period], conn)
 
-        df = pd.DataFrame(results)
-        df = df.sort_values(by="return_pct", ascending=False).reset_index(drop=True)
-        # Add timestamp for traceability
-        df["evaluated_at"] = today = datetime.date.today().isoformat()
+        with instrumentation.stage("screen_candidates"):
+            df = screen_candidates(frame, etf_returns, period=period,
+                                   min_market_cap=min_market_cap, max_price=max_price)
 
         # Save to separate database
-        candidates_db = "data/candidates.db"
-        with sqlite3.connect(candidates_db) as out_conn:
-            df.to_sql("candidates", out_conn, if_exists="replace", index=False)
-
-        print(f"✅ Stored {len(df)} rows in {candidates_db} (table: candidates)")
+        out_conn = db.connect(CANDIDATES_DB_PATH)
+        try:
+            with instrumentation.stage("write_candidates"), out_conn:
+                df.to_sql("candidates", out_conn, if_exists="replace", index=False)
+        finally:
+            out_conn.close()
+
+        print(f"✅ Stored {len(df)} rows in {CANDIDATES_DB_PATH} (table: candidates)")
         return df
 
     finally:
         conn.close()
 
-def main():
-    
-    df=list_large_optionable_tickers(min_cap=100_000_000_000)
+def main(min_cap=100_000_000_000, period="6mo", max_price=120):
+
+    with instrumentation.stage("list_large_optionable_tickers"):
+        df=list_large_optionable_tickers(min_cap=min_cap)
     tickers = df["symbol"].tolist()
-    candidates = check_outperformance_vs_sector_etf(tickers, period="6mo")
+    candidates = check_outperformance_vs_sector_etf(tickers, period=period, max_price=max_price)
     print(candidates)
 
 if __name__ == "__main__":
-    main()
+    with instrumentation.run(__file__):
+        main()
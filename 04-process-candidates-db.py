@@ -1,9 +1,12 @@
-import sqlite3
+import db
+import instrumentation
 import pandas as pd
-import yfinance as yf
 import datetime
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
+from market_data import get_provider
+from market_cache import init_cache_table, get_or_fetch_price, ensure_daily_bars
+from performance import get_performance_table
 
 DB_PATH = "data/candidates.db"
 
@@ -20,59 +23,9 @@ SECTOR_ETF_MAP = {
     "Real Estate": "XLRE",
     "Communication Services": "XLC"
 }
-def alter_price_cache_add_close_price(db_path="data/tickers.db"):
-    import sqlite3
-    conn = sqlite3.connect(db_path)
-    cur = conn.cursor()
-    cur.execute("PRAGMA table_info(price_cache)")
-    cols = [row[1] for row in cur.fetchall()]
-    if "close_price" not in cols:
-        cur.execute("ALTER TABLE price_cache ADD COLUMN close_price REAL")
-        conn.commit()
-        print("✅ Added 'close_price' column to price_cache")
-    else:
-        print("ℹ️ 'close_price' already exists in price_cache")
-    conn.close()
-
-def get_or_fetch_price(symbol, conn, today=None):
-    import datetime
-    import yfinance as yf
-
-    if today is None:
-        today = datetime.date.today().isoformat()
-
-    # Step 1: check cache
-    cur = conn.cursor()
-    cur.execute("""
-        SELECT close_price FROM price_cache
-        WHERE symbol = ? AND period = '1d' AND last_updated = ?
-    """, (symbol, today))
-    row = cur.fetchone()
-    if row and row[0] is not None:
-        return round(row[0], 2)
-
-    # Step 2: fetch from yfinance
-    try:
-        data = yf.Ticker(symbol).history(period="1d")
-        if data.empty:
-            return None
-        price = round(data["Close"].iloc[-1], 2)
-    except:
-        return None
-
-    # Step 3: store in cache
-    cur.execute("""
-        INSERT OR REPLACE INTO price_cache (symbol, period, return_pct, close_price, last_updated)
-        VALUES (?, ?, NULL, ?, ?)
-    """, (symbol, "1d", price, today))
-    conn.commit()
-
-    return price
-
-
 def display_candidates_by_sector(only_outperforming=False, only_with_dividends=False):
     
-    conn = sqlite3.connect(DB_PATH)
+    conn = db.connect(DB_PATH)
 
     # Mapping sector → ETF
     try:
@@ -123,9 +76,10 @@ def display_candidates_by_sector(only_outperforming=False, only_with_dividends=F
 
 def get_flat_candidate_table_with_prices(only_outperforming=False, only_with_dividends=False):
     db_path = "data/candidates.db"
-    conn = sqlite3.connect(db_path)
+    conn = db.connect(db_path)
     db_cache = "data/tickers.db"
-    conn_cache = sqlite3.connect(db_cache)
+    conn_cache = db.connect(db_cache)
+    init_cache_table(conn_cache)
 
     try:
         query = "SELECT symbol, sector, sector_etf, return_pct, sector_etf_pct, days_until_dividend FROM candidates"
@@ -149,9 +103,10 @@ def get_flat_candidate_table_with_prices(only_outperforming=False, only_with_div
         # Collect all unique tickers and ETFs to query once
         all_symbols = pd.unique(df[["symbol", "sector_etf"]].values.ravel())
 
-        # Fetch latest prices
-        today_str = datetime.date.today().isoformat()
-        price_map = {sym: get_or_fetch_price(sym, conn_cache, today=today_str) for sym in all_symbols}
+        # Fetch latest prices, from daily bars refreshed in one batch
+        ensure_daily_bars(all_symbols)
+        with db.transaction(conn_cache):  # One commit for all the cached prices
+            price_map = {sym: get_or_fetch_price(sym, conn_cache) for sym in all_symbols}
 
         # Map prices into DataFrame
         df["ticker_price"] = df["symbol"].map(price_map)
@@ -168,6 +123,7 @@ def get_flat_candidate_table_with_prices(only_outperforming=False, only_with_div
 
     finally:
         conn.close()
+        conn_cache.close()
 
 
 
@@ -201,11 +157,12 @@ def plot_sector_price_histories():
         """, (symbol, period))
         rows = cursor.fetchall()
 
+        instrumentation.record_cache("price_history", hits=int(bool(rows)), misses=int(not rows))
         if rows:
             return pd.DataFrame(rows, columns=["Date", symbol]).set_index("Date")
 
         try:
-            data = yf.Ticker(symbol).history(period=period)
+            data = get_provider().history(symbol, period=period)
             if data.empty:
                 return pd.DataFrame()
             hist = data[["Close"]].copy()
@@ -220,8 +177,8 @@ def plot_sector_price_histories():
             return pd.DataFrame()
 
     # Connect to DBs
-    conn_cand = sqlite3.connect(DB_CANDIDATES)
-    conn_hist = sqlite3.connect(DB_TICKERS)
+    conn_cand = db.connect(DB_CANDIDATES)
+    conn_hist = db.connect(DB_TICKERS)
     ensure_price_history_table(conn_hist)
 
     # Read candidates
@@ -286,59 +243,11 @@ def print_color_table_with_header(df, width=11):
             line += f" {color_percent(val):>{width}} |"
         print(line)
 
-def get_performance_table(tickers):
-    today = datetime.datetime.today()
-    start_ytd = datetime.datetime(today.year, 1, 1)
-
-    periods = {
-        "Perf Week": 7,
-        "Perf Month": 30,
-        "Perf Quart": 90,
-        "Perf Half": 180,
-        "Perf Year": 365,
-    }
-
-    results = []
-
-    for ticker in tickers:
-        try:
-            data = yf.Ticker(ticker).history(start=start_ytd - datetime.timedelta(days=370))
-            if data.empty:
-                continue
-
-            latest_close = data["Close"].iloc[-1]
-            row = {"Ticker": ticker}
-
-            # Compute percent changes
-            for label, days in periods.items():
-                past_date = today - datetime.timedelta(days=days)
-                data.index = data.index.tz_localize(None)  # ← This removes timezone info
-                past_prices = data[data.index <= past_date]
-                if not past_prices.empty:
-                    past_close = past_prices["Close"].iloc[-1]
-                    row[label] = round((latest_close - past_close) / past_close * 100, 2)
-                else:
-                    row[label] = None
-
-            # Year-to-date
-            ytd_data = data[data.index >= start_ytd]
-            if not ytd_data.empty:
-                ytd_start = ytd_data["Close"].iloc[0]
-                row["Perf YTD"] = round((latest_close - ytd_start) / ytd_start * 100, 2)
-            else:
-                row["Perf YTD"] = None
-
-            results.append(row)
-
-        except Exception as e:
-            print(f"⚠️ Error fetching data for {ticker}: {e}")
-
-    return pd.DataFrame(results)
-
-
 def main():
-    display_candidates_by_sector(only_outperforming=True, only_with_dividends=True)
-    df_flat = get_flat_candidate_table_with_prices(only_outperforming=True, only_with_dividends=True)
+    with instrumentation.stage("display_candidates_by_sector"):
+        display_candidates_by_sector(only_outperforming=True, only_with_dividends=True)
+    with instrumentation.stage("candidate_prices"):
+        df_flat = get_flat_candidate_table_with_prices(only_outperforming=True, only_with_dividends=True)
     print(df_flat.sort_values(by=["sector_etf","symbol"], ascending=True))
     grouped = df_flat.groupby("sector_etf")
     for etf, group in grouped:
@@ -349,14 +258,18 @@ def main():
 
 
     tickers = sorted(df_flat["symbol"].unique().tolist())
-    perf_df = get_performance_table(tickers)
-    print_color_table_with_header(perf_df)
+    sector_etfs = sorted(SECTOR_ETF_MAP.values())
 
+    # One batched download for candidates and sector ETFs together
+    with instrumentation.stage("get_performance_table"):
+        all_perf_df = get_performance_table(tickers + [t for t in sector_etfs if t not in tickers])
+    perf_df = all_perf_df[all_perf_df["Ticker"].isin(tickers)]
+    print_color_table_with_header(perf_df)
 
-    sector_etfs = sorted(SECTOR_ETF_MAP.values())
-    sector_perf_df = get_performance_table(sector_etfs)
+    sector_perf_df = all_perf_df[all_perf_df["Ticker"].isin(sector_etfs)]
     print_color_table_with_header(sector_perf_df)
 
 
 if __name__ == "__main__":
-    main()
+    with instrumentation.run(__file__):
+        main()
@@ -1,10 +1,16 @@
 import sqlite3
+import db
+import instrumentation
 import pandas as pd
-import yfinance as yf
 import datetime
 import os
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
+from market_data import get_provider
+from market_cache import init_cache_table, get_or_fetch_price, ensure_daily_bars, BARS_PERIOD, \
+    session_close, last_completed_session
+import history_store
+from close_matrix import build_close_matrix
 
 DB_PATH = "data/candidates.db"
 BASE_PATH = "./ticker_dbs"
@@ -22,58 +28,9 @@ SECTOR_ETF_MAP = {
     "Real Estate": "XLRE",
     "Communication Services": "XLC"
 }
-def alter_price_cache_add_close_price(db_path="data/tickers.db"):
-    import sqlite3
-    conn = sqlite3.connect(db_path)
-    cur = conn.cursor()
-    cur.execute("PRAGMA table_info(price_cache)")
-    cols = [row[1] for row in cur.fetchall()]
-    if "close_price" not in cols:
-        cur.execute("ALTER TABLE price_cache ADD COLUMN close_price REAL")
-        conn.commit()
-        print("✅ Added 'close_price' column to price_cache")
-    else:
-        print("ℹ️ 'close_price' already exists in price_cache")
-    conn.close()
-
-def get_or_fetch_price(symbol, conn, today=None):
-    import datetime
-    import yfinance as yf
-
-    if today is None:
-        today = datetime.date.today().isoformat()
-
-    # Step 1: check cache
-    cur = conn.cursor()
-    cur.execute("""
-        SELECT close_price FROM price_cache
-        WHERE symbol = ? AND period = '1d' AND last_updated = ?
-    """, (symbol, today))
-    row = cur.fetchone()
-    if row and row[0] is not None:
-        return round(row[0], 2)
-
-    # Step 2: fetch from yfinance
-    try:
-        data = yf.Ticker(symbol).history(period="1d")
-        if data.empty:
-            return None
-        price = round(data["Close"].iloc[-1], 2)
-    except:
-        return None
-
-    # Step 3: store in cache
-    cur.execute("""
-        INSERT OR REPLACE INTO price_cache (symbol, period, return_pct, close_price, last_updated)
-        VALUES (?, ?, NULL, ?, ?)
-    """, (symbol, "1d", price, today))
-    conn.commit()
-
-    return price
-
 def display_candidates_by_sector(only_outperforming=False, only_with_dividends=False):
     
-    conn = sqlite3.connect(DB_PATH)
+    conn = db.connect(DB_PATH)
 
     # Mapping sector → ETF
     try:
@@ -123,9 +80,10 @@ def display_candidates_by_sector(only_outperforming=False, only_with_dividends=F
 
 def get_flat_candidate_table_with_prices(only_outperforming=False, only_with_dividends=False):
     db_path = "data/candidates.db"
-    conn = sqlite3.connect(db_path)
+    conn = db.connect(db_path)
     db_cache = "data/tickers.db"
-    conn_cache = sqlite3.connect(db_cache)
+    conn_cache = db.connect(db_cache)
+    init_cache_table(conn_cache)
 
     try:
         query = "SELECT symbol, sector, sector_etf, return_pct, sector_etf_pct, days_until_dividend FROM candidates"
@@ -149,9 +107,10 @@ def get_flat_candidate_table_with_prices(only_outperforming=False, only_with_div
         # Collect all unique tickers and ETFs to query once
         all_symbols = pd.unique(df[["symbol", "sector_etf"]].values.ravel())
 
-        # Fetch latest prices
-        today_str = datetime.date.today().isoformat()
-        price_map = {sym: get_or_fetch_price(sym, conn_cache, today=today_str) for sym in all_symbols}
+        # Fetch latest prices, from daily bars refreshed in one batch
+        ensure_daily_bars(all_symbols)
+        with db.transaction(conn_cache):  # One commit for all the cached prices
+            price_map = {sym: get_or_fetch_price(sym, conn_cache) for sym in all_symbols}
 
         # Map prices into DataFrame
         df["ticker_price"] = df["symbol"].map(price_map)
@@ -168,6 +127,7 @@ def get_flat_candidate_table_with_prices(only_outperforming=False, only_with_div
 
     finally:
         conn.close()
+        conn_cache.close()
 
 def plot_sector_price_histories():
 
@@ -197,11 +157,12 @@ def plot_sector_price_histories():
         """, (symbol, period))
         rows = cursor.fetchall()
 
+        instrumentation.record_cache("price_history", hits=int(bool(rows)), misses=int(not rows))
         if rows:
             return pd.DataFrame(rows, columns=["Date", symbol]).set_index("Date")
 
         try:
-            data = yf.Ticker(symbol).history(period=period)
+            data = get_provider().history(symbol, period=period)
             if data.empty:
                 return pd.DataFrame()
             hist = data[["Close"]].copy()
@@ -216,8 +177,8 @@ def plot_sector_price_histories():
             return pd.DataFrame()
 
     # Connect to DBs
-    conn_cand = sqlite3.connect(DB_CANDIDATES)
-    conn_hist = sqlite3.connect(DB_TICKERS)
+    conn_cand = db.connect(DB_CANDIDATES)
+    conn_hist = db.connect(DB_TICKERS)
     ensure_price_history_table(conn_hist)
 
     # Read candidates
@@ -281,59 +242,10 @@ def print_color_table_with_header(df, width=11):
             line += f" {color_percent(val):>{width}} |"
         print(line)
 
-def get_performance_table(tickers):
-    today = datetime.datetime.today()
-    start_ytd = datetime.datetime(today.year, 1, 1)
-
-    periods = {
-        "Perf Week": 7,
-        "Perf Month": 30,
-        "Perf Quart": 90,
-        "Perf Half": 180,
-        "Perf Year": 365,
-    }
-
-    results = []
-
-    for ticker in tickers:
-        try:
-            data = yf.Ticker(ticker).history(start=start_ytd - datetime.timedelta(days=370))
-            if data.empty:
-                continue
-
-            latest_close = data["Close"].iloc[-1]
-            row = {"Ticker": ticker}
-
-            # Compute percent changes
-            for label, days in periods.items():
-                past_date = today - datetime.timedelta(days=days)
-                data.index = data.index.tz_localize(None)  # ← This removes timezone info
-                past_prices = data[data.index <= past_date]
-                if not past_prices.empty:
-                    past_close = past_prices["Close"].iloc[-1]
-                    row[label] = round((latest_close - past_close) / past_close * 100, 2)
-                else:
-                    row[label] = None
-
-            # Year-to-date
-            ytd_data = data[data.index >= start_ytd]
-            if not ytd_data.empty:
-                ytd_start = ytd_data["Close"].iloc[0]
-                row["Perf YTD"] = round((latest_close - ytd_start) / ytd_start * 100, 2)
-            else:
-                row["Perf YTD"] = None
-
-            results.append(row)
-
-        except Exception as e:
-            print(f"⚠️ Error fetching data for {ticker}: {e}")
-
-    return pd.DataFrame(results)
-
 def OLD_save_ticker_history(ticker, etf=None, period="1y"):
     print(f"Fetching history for {ticker}...")
     try:
-        df = yf.download(ticker, period=period, interval="1d", auto_adjust=True)
+        df = get_provider().download([ticker], period=period, interval="1d")
         if df.empty:
             print(f"No data for {ticker}")
             return
@@ -353,50 +265,49 @@ def OLD_save_ticker_history(ticker, etf=None, period="1y"):
         print(f"Error with {ticker}: {e}")
 
 
-def save_ticker_history(ticker, etf=None, period="1y"):
+def save_ticker_history(ticker, etf=None, period=BARS_PERIOD, conn=None):
     print(f"Fetching history for {ticker}...")
     try:
-        df = yf.download(ticker, period=period, interval="1d", auto_adjust=True)
-
-        if df.empty:
+        # Bars already refreshed since the last close (e.g. by ensure_daily_bars) are not fetched again
+        mode, count = history_store.refresh_history(
+            conn, ticker, etf, period=period, fresh_since=session_close(last_completed_session())
+        )
+        if mode == "none":
             print(f"No data for {ticker}")
             return
-
-        df.reset_index(inplace=True)
-
-        # Clean up any column MultiIndex
-        df.columns = [col if isinstance(col, str) else col[0] for col in df.columns]
-
-        df["Ticker"] = ticker
-        if etf:
-            df["ETF"] = etf
-
-        db_path = os.path.join(BASE_PATH, f"{ticker}.db")
-        with sqlite3.connect(db_path) as conn:
-            df.to_sql("history", conn, if_exists="replace", index=False)
-
-        print(f"Saved {len(df)} records for {ticker} in {db_path}")
+        if mode == "fresh":
+            print(f"{ticker} is up to date in {history_store.HISTORY_DB_PATH}")
+            return
+        print(f"Saved {count} records for {ticker} in {history_store.HISTORY_DB_PATH} ({mode})")
     except Exception as e:
         print(f"Error with {ticker}: {e}")
 
 
 def main():
-    os.makedirs(BASE_PATH, exist_ok=True)
-
     display_candidates_by_sector(only_outperforming=True, only_with_dividends=True)
-    df_flat = get_flat_candidate_table_with_prices(only_outperforming=True, only_with_dividends=True)
+    with instrumentation.stage("candidate_prices"):
+        df_flat = get_flat_candidate_table_with_prices(only_outperforming=True, only_with_dividends=True)
     print(df_flat.sort_values(by=["sector_etf","symbol"], ascending=True))
     grouped = df_flat.groupby("sector_etf")
     etf_tickers = {
         etf: sorted(group["symbol"].unique().tolist())
         for etf, group in grouped
     }
-    for etf, tickers in etf_tickers.items():
-        print(f"\nProcessing ETF: {etf} with {len(tickers)} tickers")
-        save_ticker_history(etf, etf)
-        for ticker in tickers:
-            save_ticker_history(ticker, etf)
+    conn = history_store.connect()
+    try:
+        with instrumentation.stage("save_ticker_history"):
+            for etf, tickers in etf_tickers.items():
+                print(f"\nProcessing ETF: {etf} with {len(tickers)} tickers")
+                save_ticker_history(etf, etf, conn=conn)
+                for ticker in tickers:
+                    save_ticker_history(ticker, etf, conn=conn)
+        # Readers (07) memory-map this instead of querying the store
+        with instrumentation.stage("build_close_matrix"):
+            build_close_matrix(conn)
+    finally:
+        conn.close()
 
 
 if __name__ == "__main__":
-    main()
+    with instrumentation.run(__file__):
+        main()
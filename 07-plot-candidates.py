@@ -1,8 +1,23 @@
 import sqlite3
+import db
+import instrumentation
 import pandas as pd
+import numpy as np
 import os
+import json
+import time
+import hashlib
 import datetime
+import matplotlib
 import matplotlib.pyplot as plt
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from market_cache import init_cache_table, get_or_fetch_price, ensure_daily_bars
+import history_store
+from close_matrix import open_close_matrix
+
+CHART_DIR = "./etf_charts"
+RENDER_MANIFEST = os.path.join(CHART_DIR, ".render_hashes.json")  # input hash of each chart
+RENDER_WORKERS = os.cpu_count()
 
 SECTOR_ETF_MAP = {
     "Technology": "XLK",
@@ -20,47 +35,13 @@ SECTOR_ETF_MAP = {
 
 
 
-def get_or_fetch_price(symbol, conn, today=None):
-    import datetime
-    import yfinance as yf
-
-    if today is None:
-        today = datetime.date.today().isoformat()
-
-    # Step 1: check cache
-    cur = conn.cursor()
-    cur.execute("""
-        SELECT close_price FROM price_cache
-        WHERE symbol = ? AND period = '1d' AND last_updated = ?
-    """, (symbol, today))
-    row = cur.fetchone()
-    if row and row[0] is not None:
-        return round(row[0], 2)
-
-    # Step 2: fetch from yfinance
-    try:
-        data = yf.Ticker(symbol).history(period="1d")
-        if data.empty:
-            return None
-        price = round(data["Close"].iloc[-1], 2)
-    except:
-        return None
-
-    # Step 3: store in cache
-    cur.execute("""
-        INSERT OR REPLACE INTO price_cache (symbol, period, return_pct, close_price, last_updated)
-        VALUES (?, ?, NULL, ?, ?)
-    """, (symbol, "1d", price, today))
-    conn.commit()
-
-    return price
-
 
 def get_flat_candidate_table_with_prices(only_outperforming=False, only_with_dividends=False):
     db_path = "data/candidates.db"
-    conn = sqlite3.connect(db_path)
+    conn = db.connect(db_path)
     db_cache = "data/tickers.db"
-    conn_cache = sqlite3.connect(db_cache)
+    conn_cache = db.connect(db_cache)
+    init_cache_table(conn_cache)
 
     try:
         query = "SELECT symbol, sector, sector_etf, return_pct, sector_etf_pct, days_until_dividend FROM candidates"
@@ -84,9 +65,10 @@ def get_flat_candidate_table_with_prices(only_outperforming=False, only_with_div
         # Collect all unique tickers and ETFs to query once
         all_symbols = pd.unique(df[["symbol", "sector_etf"]].values.ravel())
 
-        # Fetch latest prices
-        today_str = datetime.date.today().isoformat()
-        price_map = {sym: get_or_fetch_price(sym, conn_cache, today=today_str) for sym in all_symbols}
+        # Fetch latest prices, from daily bars refreshed in one batch
+        ensure_daily_bars(all_symbols)
+        with db.transaction(conn_cache):  # One commit for all the cached prices
+            price_map = {sym: get_or_fetch_price(sym, conn_cache) for sym in all_symbols}
 
         # Map prices into DataFrame
         df["ticker_price"] = df["symbol"].map(price_map)
@@ -103,29 +85,28 @@ def get_flat_candidate_table_with_prices(only_outperforming=False, only_with_div
 
     finally:
         conn.close()
+        conn_cache.close()
+
 
+def one_year_ago():
+    # The history store only grows: plots keep to the last year
+    return datetime.date.today() - datetime.timedelta(days=365)
 
-def plot_etf_tickers(etf, tickers, base_path="./ticker_dbs"):
+def plot_etf_tickers(etf, tickers, db_path=history_store.HISTORY_DB_PATH):
     if not tickers:
         print(f"No tickers found for ETF '{etf}'.")
         return
 
+    closes = history_store.read_closes(tickers, start=one_year_ago(), db_path=db_path)
+
     plt.figure(figsize=(14, 7))
-    
-    for ticker in tickers:
-        db_path = os.path.join(base_path, f"{ticker}.db")
-        if not os.path.exists(db_path):
-            print(f"DB for {ticker} not found. Skipping.")
-            continue
 
-        try:
-            with sqlite3.connect(db_path) as conn:
-                df = pd.read_sql("SELECT Date, Close FROM history", conn, parse_dates=["Date"])
-                df.sort_values("Date", inplace=True)
-                plt.plot(df["Date"], df["Close"], label=ticker)
-        except Exception as e:
-            print(f"Error reading {ticker}: {e}")
+    for ticker in tickers:
+        if ticker not in closes.columns:
+            print(f"History for {ticker} not found. Skipping.")
             continue
+        series = closes[ticker].dropna()
+        plt.plot(series.index, series.values, label=ticker)
 
     plt.title(f"{etf} — 1 Year Price History")
     plt.xlabel("Date")
@@ -178,53 +159,40 @@ def unused_plot_etf_tickers_relative(etf, tickers, base_path="./ticker_dbs"):
     plt.show()
 
 
-def plot_etf_tickers_relative(etf, tickers, base_path="./ticker_dbs", output_dir="./etf_charts"):
-    if not tickers:
-        print(f"No tickers found for ETF '{etf}'.")
-        return
-
-    # Ensure output directory exists
-    os.makedirs(output_dir, exist_ok=True)
-
-    # Ensure ETF is included and not duplicated
-    tickers = [etf] + [t for t in tickers if t != etf]
+def relative_series(tickers, start=None, matrix=None):
+    """
+    Relative performance (%) of each ticker since `start`, read from the
+    memory-mapped close matrix.
 
-    # Step 1: Collect last prices
-    ticker_data = []
+    Returns:
+        list of (ticker, dates, pct, last_price), in the order of `tickers`
+    """
+    matrix = matrix or open_close_matrix()
     for ticker in tickers:
-        db_path = os.path.join(base_path, f"{ticker}.db")
-        if not os.path.exists(db_path):
-            print(f"DB for {ticker} not found. Skipping.")
-            continue
-
-        try:
-            with sqlite3.connect(db_path) as conn:
-                df = pd.read_sql("SELECT Date, Close FROM history", conn, parse_dates=["Date"])
-                df.sort_values("Date", inplace=True)
-                last_price = df["Close"].iloc[-1]
-                ticker_data.append((ticker, df, last_price))
-        except Exception as e:
-            print(f"Error reading {ticker}: {e}")
-            continue
-
-    if not ticker_data:
-        print("No valid data to plot.")
-        return
-
-    # Step 2: Sort by last price
-    ticker_data.sort(key=lambda x: x[2])  # x[2] is last_price
+        if ticker not in matrix:
+            print(f"History for {ticker} not found. Skipping.")
+    dates, found, pct = matrix.relative(tickers, start=start)
+    last_prices = matrix.last(found)
+    series = []
+    for ticker, row in zip(found, pct):
+        valid = ~np.isnan(row)
+        if valid.any():
+            series.append((ticker, dates[valid], row[valid], last_prices[ticker]))
+    return series
+
+def render_etf_chart(etf, ticker_data, save_path):
+    # ticker_data: output of relative_series()
+    ticker_data = sorted(ticker_data, key=lambda x: x[3])  # Sort by last price
 
-    # Step 3: Plot
     plt.figure(figsize=(14, 7))
 
-    for i, (ticker, df, last_price) in enumerate(ticker_data):
-        df["Pct"] = (df["Close"] / df["Close"].iloc[0] - 1) * 100
+    for ticker, dates, pct, last_price in ticker_data:
         label = f"{ticker} (${last_price:.2f})"
         if ticker == etf:
             label += " (ETF)"
-            plt.plot(df["Date"], df["Pct"], label=label, linewidth=3.5, linestyle="--")
+            plt.plot(dates, pct, label=label, linewidth=3.5, linestyle="--")
         else:
-            plt.plot(df["Date"], df["Pct"], label=label, linewidth=1.2)
+            plt.plot(dates, pct, label=label, linewidth=1.2)
 
     plt.title(f"{etf} & Tickers — Relative 1-Year Performance (%)")
     plt.xlabel("Date")
@@ -234,44 +202,16 @@ def plot_etf_tickers_relative(etf, tickers, base_path="./ticker_dbs", output_dir
     plt.grid(True)
     plt.tight_layout()
 
-    # Step 4: Save the plot
-    save_path = os.path.join(output_dir, f"{etf}_relative.png")
     plt.savefig(save_path, dpi=300)
     plt.close()
-    print(f"Saved plot to {save_path}")
-
-def plot_all_sector_etfs_relative(etf_list, base_path="./ticker_dbs", output_path="./etf_charts/all_etfs_relative.png"):
-    import matplotlib.pyplot as plt
-    import os
 
-    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+def render_all_etfs_chart(data, output_path):
+    data = sorted(data, key=lambda x: x[2][-1])  # Sort by last % return
 
     plt.figure(figsize=(14, 7))
 
-    data = []
-    for etf in etf_list:
-        db_path = os.path.join(base_path, f"{etf}.db")
-        if not os.path.exists(db_path):
-            print(f"DB for {etf} not found. Skipping.")
-            continue
-
-        try:
-            with sqlite3.connect(db_path) as conn:
-                df = pd.read_sql("SELECT Date, Close FROM history", conn, parse_dates=["Date"])
-                df.sort_values("Date", inplace=True)
-                df["Pct"] = (df["Close"] / df["Close"].iloc[0] - 1) * 100
-                last_price = df["Close"].iloc[-1]
-                label = f"{etf} (${last_price:.2f})"
-                data.append((etf, df["Date"], df["Pct"], label))
-        except Exception as e:
-            print(f"Error reading {etf}: {e}")
-            continue
-
-    # Optional: sort by last performance
-    data.sort(key=lambda x: x[2].iloc[-1])  # Sort by last % return
-
-    for etf, dates, pct, label in data:
-        plt.plot(dates, pct, label=label)
+    for etf, dates, pct, last_price in data:
+        plt.plot(dates, pct, label=f"{etf} (${last_price:.2f})")
 
     plt.title("Sector ETFs — Relative Performance (%)")
     plt.xlabel("Date")
@@ -283,23 +223,122 @@ def plot_all_sector_etfs_relative(etf_list, base_path="./ticker_dbs", output_pat
     plt.savefig(output_path, dpi=300)
     plt.close()
 
+def plot_etf_tickers_relative(etf, tickers, output_dir=CHART_DIR, matrix=None):
+    if not tickers:
+        print(f"No tickers found for ETF '{etf}'.")
+        return
+
+    # Ensure output directory exists
+    os.makedirs(output_dir, exist_ok=True)
+
+    # Ensure ETF is included and not duplicated
+    tickers = [etf] + [t for t in tickers if t != etf]
+
+    # Relative series and last prices, straight from the close matrix
+    ticker_data = relative_series(tickers, start=one_year_ago(), matrix=matrix)
+
+    if not ticker_data:
+        print("No valid data to plot.")
+        return
+
+    save_path = os.path.join(output_dir, f"{etf}_relative.png")
+    render_etf_chart(etf, ticker_data, save_path)
+    print(f"Saved plot to {save_path}")
+
+def plot_all_sector_etfs_relative(etf_list, output_path=os.path.join(CHART_DIR, "all_etfs_relative.png"), matrix=None):
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    data = relative_series(etf_list, start=one_year_ago(), matrix=matrix)
+    render_all_etfs_chart(data, output_path)
     print(f"✅ Saved sector ETF plot to {output_path}")
 
+def chart_hash(kind, name, data):
+    # Hash of everything a chart is drawn from: unchanged hash, unchanged image
+    h = hashlib.sha256(f"{kind}|{name}".encode())
+    for ticker, dates, pct, last_price in data:
+        h.update(ticker.encode())
+        h.update(np.ascontiguousarray(dates).tobytes())
+        h.update(np.ascontiguousarray(pct).tobytes())
+        h.update(np.float64(last_price).tobytes())
+    return h.hexdigest()
+
+def render_job(job):
+    # Runs in a worker process: non-interactive backend, no display needed
+    matplotlib.use("Agg")
+    start = time.perf_counter()
+    if job["kind"] == "etf":
+        render_etf_chart(job["name"], job["data"], job["path"])
+    else:
+        render_all_etfs_chart(job["data"], job["path"])
+    return time.perf_counter() - start
+
+def render_charts(etf_tickers, etf_list, output_dir=CHART_DIR, manifest_path=RENDER_MANIFEST, workers=RENDER_WORKERS, matrix=None):
+    """
+    Renders every <ETF>_relative.png plus all_etfs_relative.png on a process
+    pool. Charts whose input data did not change since the last render are skipped.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    matrix = matrix or open_close_matrix()
+    start = one_year_ago()
+
+    jobs = []
+    for etf, tickers in etf_tickers.items():
+        tickers = [etf] + [t for t in tickers if t != etf]
+        data = relative_series(tickers, start=start, matrix=matrix)
+        if not data:
+            print(f"No valid data to plot for {etf}.")
+            continue
+        jobs.append({"kind": "etf", "name": etf, "data": data,
+                     "path": os.path.join(output_dir, f"{etf}_relative.png")})
+    data = relative_series(etf_list, start=start, matrix=matrix)
+    if data:
+        jobs.append({"kind": "all", "name": "all_etfs", "data": data,
+                     "path": os.path.join(output_dir, "all_etfs_relative.png")})
+
+    manifest = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+
+    todo = []
+    for job in jobs:
+        job["hash"] = chart_hash(job["kind"], job["name"], job["data"])
+        if manifest.get(job["path"]) == job["hash"] and os.path.exists(job["path"]):
+            print(f"⏭️  {job['path']} unchanged, skipped")
+        else:
+            todo.append(job)
+
+    total = time.perf_counter()
+    if todo:
+        with ProcessPoolExecutor(max_workers=min(workers, len(todo))) as executor:
+            futures = {executor.submit(render_job, job): job for job in todo}
+            for future in as_completed(futures):
+                job = futures[future]
+                try:
+                    seconds = future.result()
+                except Exception as e:
+                    print(f"❌ Failed to render {job['path']}: {e}")
+                    continue
+                manifest[job["path"]] = job["hash"]
+                print(f"Saved plot to {job['path']} ({seconds:.2f}s)")
+
+    with open(manifest_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    print(f"✅ Rendered {len(todo)} of {len(jobs)} charts in {time.perf_counter() - total:.2f}s")
 
 
 def main():
-    df_flat = get_flat_candidate_table_with_prices(only_outperforming=True, only_with_dividends=True)
+    with instrumentation.stage("candidate_prices"):
+        df_flat = get_flat_candidate_table_with_prices(only_outperforming=True, only_with_dividends=True)
     print(df_flat.sort_values(by=["sector_etf","symbol"], ascending=True))
     grouped = df_flat.groupby("sector_etf")
     etf_tickers = {
         etf: sorted(group["symbol"].unique().tolist())
         for etf, group in grouped
     }
-    for etf, tickers in etf_tickers.items():
-        plot_etf_tickers_relative(etf, tickers)
-
-    plot_all_sector_etfs_relative(list(SECTOR_ETF_MAP.values()))
+    with instrumentation.stage("render_charts"):
+        render_charts(etf_tickers, list(SECTOR_ETF_MAP.values()))
 if __name__ == "__main__":
-    main()
+    with instrumentation.run(__file__):
+        main()
     #with sqlite3.connect("ticker_dbs/ABBV.db") as conn:
     #    print(pd.read_sql("PRAGMA table_info(history);", conn))
@@ -0,0 +1,157 @@
+import db
+import instrumentation
+import numpy as np
+import pandas as pd
+from fetch_pool import run_pool
+from market_cache import daily_closes
+from option_chains import get_chain_cache, spread_frame
+from option_greeks import chain_greeks
+
+CANDIDATES_DB_PATH = "data/candidates.db"
+REQUESTS_PER_SECOND = 2  # Option requests per second (expiry lists and chains)
+CONCURRENCY = 4
+MAX_RETRIES = 3
+
+NEAREST_EXPIRIES = 3  # Expiries screened per ticker, nearest first
+NTM_BAND = 0.05  # Near the money: strikes within ±5% of the last close
+MAX_SPREAD_PCT = 10.0  # Liquid: median near-the-money spread (% of mid) at most...
+MIN_OPEN_INTEREST = 1_000  # ...and near-the-money open interest at least
+
+LIQUIDITY_COLUMNS = [
+    "opt_expiries", "opt_ntm_contracts", "opt_ntm_spread_pct",
+    "opt_atm_spread_pct", "opt_ntm_open_interest", "opt_liquid"
+]
+
+
+def fetch_chains(symbols, expiries=NEAREST_EXPIRIES, rate=REQUESTS_PER_SECOND, concurrency=CONCURRENCY, cache=None):
+    """
+    Calls and puts of the nearest `expiries` of every symbol, fetched on the
+    rate-limited pool through the chain snapshot cache.
+
+    Returns:
+        one frame: symbol, expiry, type and the spread_frame() columns
+    """
+    cache = cache or get_chain_cache()
+
+    dates = {}
+    run_pool(
+        symbols, cache.options,
+        on_result=lambda s, exp: dates.__setitem__(s, list(exp)[:expiries]),
+        on_failure=lambda s, e: print(f"⚠️ No expiries for {s}: {e}"),
+        rate=rate, concurrency=concurrency, max_retries=MAX_RETRIES,
+    )
+
+    frames = []
+
+    def on_chain(item, chain):
+        symbol, expiry = item
+        for kind, side in (("call", chain.calls), ("put", chain.puts)):
+            df = spread_frame(side)
+            df.insert(0, "type", kind)
+            df.insert(0, "expiry", expiry)
+            df.insert(0, "symbol", symbol)
+            frames.append(df)
+
+    pairs = [(s, e) for s in symbols for e in dates.get(s, [])]
+    run_pool(
+        pairs, lambda item: cache.chain(*item),
+        on_result=on_chain,
+        on_failure=lambda item, e: print(f"⚠️ No chain for {item[0]} {item[1]}: {e}"),
+        rate=rate, concurrency=concurrency, max_retries=MAX_RETRIES,
+    )
+    if not frames:
+        return pd.DataFrame(columns=["symbol", "expiry", "type"])
+    return pd.concat(frames, ignore_index=True)
+
+
+def liquidity_metrics(chains, spots, band=NTM_BAND, max_spread_pct=MAX_SPREAD_PCT, min_open_interest=MIN_OPEN_INTEREST):
+    """
+    Per-symbol liquidity of the contracts near the money, from whole columns:
+
+        opt_expiries          : expiries screened
+        opt_ntm_contracts     : contracts with a strike within ±band of the spot
+        opt_ntm_spread_pct    : their median spread, % of mid
+        opt_atm_spread_pct    : mean call/put spread % at the strike nearest the spot, nearest expiry
+        opt_ntm_open_interest : their total open interest
+        opt_liquid            : spread and open interest within the limits
+
+    Params:
+        chains : frame of fetch_chains()
+        spots  : Series symbol -> last close
+    """
+    metrics = pd.DataFrame(index=pd.Index(spots.index, name="symbol"))
+    if chains.empty:
+        for col in LIQUIDITY_COLUMNS:
+            metrics[col] = False if col == "opt_liquid" else np.nan
+        return metrics.reset_index()
+
+    df = chains.copy()
+    df["spot"] = df["symbol"].map(spots)
+    df["moneyness"] = df["strike"] / df["spot"] - 1
+    ntm = df[df["moneyness"].abs() <= band]
+    grouped = ntm.groupby("symbol")
+    metrics["opt_expiries"] = df.groupby("symbol")["expiry"].nunique()
+    metrics["opt_ntm_contracts"] = grouped.size()
+    metrics["opt_ntm_spread_pct"] = grouped["spread_pct"].median().round(2)
+    metrics["opt_ntm_open_interest"] = grouped["openInterest"].sum()
+
+    # At the money: nearest expiry, strike closest to the spot
+    nearest = df[df["expiry"] == df.groupby("symbol")["expiry"].transform("min")].copy()
+    nearest["distance"] = nearest["moneyness"].abs()
+    closest = nearest[nearest["distance"] == nearest.groupby("symbol")["distance"].transform("min")]
+    metrics["opt_atm_spread_pct"] = closest.groupby("symbol")["spread_pct"].mean().round(2)
+
+    metrics["opt_ntm_contracts"] = metrics["opt_ntm_contracts"].fillna(0).astype(int)
+    metrics["opt_liquid"] = (
+        (metrics["opt_ntm_spread_pct"] <= max_spread_pct)
+        & (metrics["opt_ntm_open_interest"] >= min_open_interest)
+    )
+    return metrics[LIQUIDITY_COLUMNS].reset_index()
+
+
+def screen_options_liquidity(db_path=CANDIDATES_DB_PATH, expiries=NEAREST_EXPIRIES, rate=REQUESTS_PER_SECOND,
+                             concurrency=CONCURRENCY):
+    """
+    Adds the liquidity_metrics() columns to the candidates table, and
+    stores the IV and greeks of every fetched contract (the IV surfaces of
+    the candidates) in the option_greeks table.
+    """
+    conn = db.connect(db_path)
+    try:
+        candidates = pd.read_sql("SELECT * FROM candidates", conn)
+        if candidates.empty:
+            print("No candidates found.")
+            return candidates
+        candidates = candidates.drop(columns=[c for c in LIQUIDITY_COLUMNS if c in candidates.columns])
+        symbols = candidates["symbol"].tolist()
+
+        with instrumentation.stage("daily_closes"):
+            closes = daily_closes(symbols)
+        spots = closes.ffill().iloc[-1] if not closes.empty else pd.Series(dtype=float)
+        spots = spots.reindex(symbols)
+
+        with instrumentation.stage("fetch_chains"):
+            chains = fetch_chains(symbols, expiries, rate, concurrency)
+        with instrumentation.stage("liquidity_metrics"):
+            metrics = liquidity_metrics(chains, spots)
+        candidates = candidates.merge(metrics, on="symbol", how="left")
+        with instrumentation.stage("chain_greeks"):
+            greeks = chain_greeks(chains, spots) if not chains.empty else chains
+
+        with instrumentation.stage("write_candidates"), conn:
+            candidates.to_sql("candidates", conn, if_exists="replace", index=False)
+            greeks.to_sql("option_greeks", conn, if_exists="replace", index=False)
+        print(f"✅ Options liquidity of {len(candidates)} candidates: {int(candidates['opt_liquid'].fillna(False).sum())} liquid")
+        return candidates
+    finally:
+        conn.close()
+
+
+def main():
+    candidates = screen_options_liquidity()
+    print(candidates[["symbol", "sector"] + LIQUIDITY_COLUMNS])
+
+
+if __name__ == "__main__":
+    with instrumentation.run(__file__):
+        main()
@@ -0,0 +1,257 @@
+import os
+import io
+import sys
+import json
+import time
+import shutil
+import datetime
+import platform
+import tempfile
+import statistics
+import subprocess
+import contextlib
+from importlib import import_module
+import db
+import numpy as np
+import pandas as pd
+import market_cache
+from market_data import FakeProvider, set_provider
+from migrations import migrate
+from performance import get_performance_table
+from screening import screen_candidates, period_return_table
+from close_matrix import build_close_matrix, CloseMatrix
+from option_chains import spread_frame
+from option_greeks import chain_greeks
+
+listings = import_module("01-create-db-from-tickers-list")
+candidates = import_module("03-create-candidate-db")
+sectors = import_module("04-process-candidates-db")
+plots = import_module("07-plot-candidates")
+
+BENCHMARK_SIZES = [500, 2000]  # Symbols of each synthetic universe
+REPEAT = 5  # Runs of each stage, the median is compared between versions
+RESULTS_DIR = "benchmarks"
+CHAIN_SYMBOLS = 200  # Option chains (one expiry each) of the IV and greeks stage
+SCREEN_PERIOD = "6mo"
+
+
+def symbol_name(i):
+    # AAAA, AAAB, ...: four letters, like a real listing
+    return "".join(chr(65 + (i // 26 ** k) % 26) for k in (3, 2, 1, 0))
+
+
+def write_listing_files(symbols, nasdaq_file, nyse_file):
+    """
+    Listing files in the nasdaqlisted.txt / otherlisted.txt formats: two
+    thirds of the symbols on NASDAQ, the others on NYSE, with a share of
+    warrants, units and ETFs for the pre-filter to exclude.
+    """
+    rng = np.random.default_rng(0)
+    kinds = rng.choice(["Common Stock", "Warrants", "Units", "ETF"], size=len(symbols), p=[0.85, 0.06, 0.04, 0.05])
+    nasdaq, nyse = ["Symbol|Security Name|Market Category|Test Issue|Financial Status|Round Lot Size|ETF|NextShares"], \
+        ["ACT Symbol|Security Name|Exchange|CQS Symbol|ETF|Round Lot Size|Test Issue|NASDAQ Symbol"]
+    for i, (symbol, kind) in enumerate(zip(symbols, kinds)):
+        etf = "Y" if kind == "ETF" else "N"
+        if i % 3:
+            nasdaq.append(f"{symbol}|{symbol} Inc. - {kind}|Q|N|N|100|{etf}|N")
+        else:
+            nyse.append(f"{symbol}|{symbol} Inc. {kind}|N|{symbol}|{etf}|100|N|{symbol}")
+    created = f"File Creation Time: {datetime.datetime.now():%m%d%Y%H:%M}|||||||"
+    for path, lines in ((nasdaq_file, nasdaq), (nyse_file, nyse)):
+        with open(path, "w") as f:
+            f.write("\n".join(lines + [created]) + "\n")
+
+
+def store_ticker_info(symbols, provider, db_path):
+    # ticker_info rows as step 02 leaves them, from the fake provider
+    rng = np.random.default_rng(1)
+    rows = []
+    for symbol in symbols:
+        info = provider.info(symbol)
+        has_dividend = int(rng.random() < 0.6)
+        rows.append((symbol, info["sector"], info["marketCap"], 1, has_dividend,
+                     int(rng.integers(1, 90)) if has_dividend else None))
+    conn = db.connect(db_path)
+    try:
+        migrate(conn)
+        with db.transaction(conn):
+            conn.executemany("""
+                INSERT INTO ticker_info (symbol, sector, marketCap, isOptionable, has_dividend, days_until_dividend)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, rows)
+    finally:
+        conn.close()
+
+
+@contextlib.contextmanager
+def synthetic_universe(size):
+    """
+    Runs the block in a temporary working directory holding a `size`-symbol
+    universe: listing files, ticker_info and the daily bars of every symbol
+    and sector ETF, all from FakeProvider. Nothing is fetched from Yahoo.
+    """
+    cwd = os.getcwd()
+    workdir = tempfile.mkdtemp(prefix="tickers-bench-")
+    provider = FakeProvider(days=600)
+    set_provider(provider)
+    market_cache._bars_conn = None  # Bound to the history.db of the previous working directory
+    try:
+        os.chdir(workdir)
+        os.makedirs("data")
+        symbols = [symbol_name(i) for i in range(size)]
+        write_listing_files(symbols, listings.NASDAQ_FILE, listings.NYSE_FILE)
+        with contextlib.redirect_stdout(io.StringIO()):
+            store_ticker_info(symbols, provider, candidates.DB_PATH)
+        yield provider, symbols
+    finally:
+        db.close_all()
+        market_cache._bars_conn = None
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def timed(fn, repeat=REPEAT):
+    # Wall time of `repeat` runs of fn(), its output silenced
+    runs = []
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            fn()
+            runs.append(time.perf_counter() - start)
+    return {
+        "median": statistics.median(runs),
+        "min": min(runs),
+        "mean": statistics.mean(runs),
+        "repeat": repeat,
+    }
+
+
+def run_benchmarks(size, repeat=REPEAT):
+    """
+    Times the compute paths of the pipeline on a synthetic universe.
+
+    Returns:
+        dict stage -> timings (seconds)
+    """
+    results = {}
+    with synthetic_universe(size) as (provider, symbols):
+        etfs = list(candidates.SECTOR_ETF_MAP.values())
+
+        # Listing parsing and pre-filter (step 01)
+        results["process_files"] = timed(lambda: listings.process_files(listings.NASDAQ_FILE, listings.NYSE_FILE), repeat)
+
+        # Cold fill of the history store, then every read is served from it
+        results["ensure_daily_bars"] = timed(lambda: market_cache.ensure_daily_bars(symbols + etfs), 1)
+        results["get_performance_table"] = timed(lambda: get_performance_table(symbols), repeat)
+
+        # Screening of step 03: frame from ticker_info and the bars, then the filters
+        conn = db.connect(candidates.DB_PATH)
+        try:
+            etf_closes = market_cache.daily_closes(etfs)
+            etf_returns = period_return_table(etf_closes, [SCREEN_PERIOD]).rename(index={
+                etf: sector for sector, etf in candidates.SECTOR_ETF_MAP.items()
+            }).rename_axis("sector").reset_index()
+            etf_returns.insert(1, "sector_etf", etf_returns["sector"].map(candidates.SECTOR_ETF_MAP))
+
+            def screen():
+                frame = candidates.build_screening_frame(symbols, [SCREEN_PERIOD], conn)
+                return screen_candidates(frame, etf_returns, period=SCREEN_PERIOD, max_price=None)
+
+            results["screening"] = timed(screen, repeat)
+            table = screen()
+        finally:
+            conn.close()
+
+        # Sector aggregation of step 04, over the screened candidates
+        out_conn = db.connect(sectors.DB_PATH)
+        try:
+            with out_conn:
+                table.to_sql("candidates", out_conn, if_exists="replace", index=False)
+        finally:
+            out_conn.close()
+        results["display_candidates_by_sector"] = timed(sectors.display_candidates_by_sector, repeat)
+
+        # History loading of step 07: close matrix, then relative series by sector
+        results["build_close_matrix"] = timed(lambda: build_close_matrix(market_cache.bars_connection()), repeat)
+        matrix = CloseMatrix()
+        by_etf = table.groupby("sector_etf")["symbol"].apply(list)
+        start = plots.one_year_ago()
+        results["relative_series"] = timed(
+            lambda: [plots.relative_series(tickers, start=start, matrix=matrix) for tickers in by_etf], repeat
+        )
+
+        # IV and greeks of one chain per symbol
+        frames = []
+        for symbol in symbols[:CHAIN_SYMBOLS]:
+            expiry = provider.options(symbol)[0]
+            chain = provider.option_chain(symbol, expiry)
+            for kind, side in (("call", chain.calls), ("put", chain.puts)):
+                df = spread_frame(side)
+                df.insert(0, "type", kind)
+                df.insert(0, "expiry", expiry)
+                df.insert(0, "symbol", symbol)
+                frames.append(df)
+        chains = pd.concat(frames, ignore_index=True)
+        spots = pd.Series(matrix.last(symbols[:CHAIN_SYMBOLS]))
+        results["chain_greeks"] = timed(lambda: chain_greeks(chains, spots), repeat)
+        results["chain_greeks"]["contracts"] = len(chains)
+    return results
+
+
+def git_version():
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def previous_report(results_dir=RESULTS_DIR):
+    reports = sorted(
+        (os.path.join(results_dir, name) for name in os.listdir(results_dir) if name.endswith(".json")),
+        key=os.path.getmtime
+    ) if os.path.isdir(results_dir) else []
+    if not reports:
+        return None
+    with open(reports[-1]) as f:
+        return json.load(f)
+
+
+def print_report(report, previous=None):
+    for size, stages in report["sizes"].items():
+        print(f"\n📏 {size} symbols")
+        before = (previous or {}).get("sizes", {}).get(size, {})
+        for stage, timing in stages.items():
+            line = f"   {stage:<30} {timing['median'] * 1000:10.1f} ms"
+            if stage in before:
+                ratio = timing["median"] / before[stage]["median"]
+                line += f"   x{ratio:.2f} vs {previous['version']}"
+            print(line)
+
+
+def main(sizes=BENCHMARK_SIZES, repeat=REPEAT, results_dir=RESULTS_DIR):
+    previous = previous_report(results_dir)
+    report = {
+        "version": git_version(),
+        "created_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "repeat": repeat,
+        "sizes": {},
+    }
+    for size in sizes:
+        print(f"⏱️ Benchmarking a {size}-symbol universe...")
+        report["sizes"][str(size)] = run_benchmarks(size, repeat)
+
+    os.makedirs(results_dir, exist_ok=True)
+    path = os.path.join(results_dir, f"{report['created_at'].replace(':', '')}-{report['version']}.json")
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+    print_report(report, previous)
+    print(f"\n✅ Results saved to {path}")
+    return report
+
+
+if __name__ == "__main__":
+    main(sizes=[int(s) for s in sys.argv[1:]] or BENCHMARK_SIZES)
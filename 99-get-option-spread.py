@@ -1,9 +1,12 @@
-import yfinance as yf
+import instrumentation
+from option_chains import option_spreads
 
 
 def get_option_spread(ticker, expiry=None, strike=None, call=True):
     """
     Fetches bid-ask spread for a given option (call/put) on a ticker.
+    The chain comes from the snapshot cache of option_chains: asking for
+    other strikes of the same expiry does not download it again.
 
     Params:
         ticker  : str  — e.g. "AAPL"
@@ -14,32 +17,23 @@ def get_option_spread(ticker, expiry=None, strike=None, call=True):
     Returns:
         dict with bid, ask, spread
     """
-    tk = yf.Ticker(ticker)
-
-    if expiry is None:
-        expiry = tk.options[0]  # default: nearest expiry
-
-    opt_chain = tk.option_chain(expiry)
-    opt_df = opt_chain.calls if call else opt_chain.puts
-
-    row = opt_df[opt_df['strike'] == strike]
-    if row.empty:
-        return {"error": f"No option found for strike {strike} on {expiry}"}
-
-    bid = row['bid'].values[0]
-    ask = row['ask'].values[0]
-    spread = round(ask - bid, 2) if bid is not None and ask is not None else None
+    spreads = option_spreads(ticker, expiry=expiry, strikes=[strike], call=call)
+    row = spreads.iloc[0]
+    if row.isna()[["bid", "ask"]].all():
+        return {"error": f"No option found for strike {strike} on {row['expiry']}"}
 
     return {
         "ticker": ticker,
-        "type": "call" if call else "put",
-        "expiry": expiry,
+        "type": row["type"],
+        "expiry": row["expiry"],
         "strike": strike,
-        "bid": bid,
-        "ask": ask,
-        "spread": spread
+        "bid": row["bid"],
+        "ask": row["ask"],
+        "spread": row["spread"]
     }
 
 
-result = get_option_spread("AAPL", expiry="2025-06-20", strike=200.0, call=True)
-print(result)
+if __name__ == "__main__":
+    with instrumentation.run(__file__):
+        result = get_option_spread("AAPL", expiry="2025-06-20", strike=200.0, call=True)
+        print(result)
@@ -1,6 +1,6 @@
-import yfinance as yf
 import pandas as pd
-import datetime
+import instrumentation
+from performance import get_performance_table
 
 def color_percent(value):
     if value is None:
@@ -30,56 +30,6 @@ def print_color_table_with_header(df, width=11):
             line += f" {color_percent(val):>{width}} |"
         print(line)
 
-def get_performance_table(tickers):
-    today = datetime.datetime.today()
-    start_ytd = datetime.datetime(today.year, 1, 1)
-
-    periods = {
-        "Perf Week": 7,
-        "Perf Month": 30,
-        "Perf Quart": 90,
-        "Perf Half": 180,
-        "Perf Year": 365,
-    }
-
-    results = []
-
-    for ticker in tickers:
-        try:
-            data = yf.Ticker(ticker).history(start=start_ytd - datetime.timedelta(days=370))
-            if data.empty:
-                continue
-
-            latest_close = data["Close"].iloc[-1]
-            row = {"Ticker": ticker}
-
-            # Compute percent changes
-            for label, days in periods.items():
-                past_date = today - datetime.timedelta(days=days)
-                data.index = data.index.tz_localize(None)  # ← This removes timezone info
-                past_prices = data[data.index <= past_date]
-                if not past_prices.empty:
-                    past_close = past_prices["Close"].iloc[-1]
-                    row[label] = round((latest_close - past_close) / past_close * 100, 2)
-                else:
-                    row[label] = None
-
-            # Year-to-date
-            ytd_data = data[data.index >= start_ytd]
-            if not ytd_data.empty:
-                ytd_start = ytd_data["Close"].iloc[0]
-                row["Perf YTD"] = round((latest_close - ytd_start) / ytd_start * 100, 2)
-            else:
-                row["Perf YTD"] = None
-
-            results.append(row)
-
-        except Exception as e:
-            print(f"⚠️ Error fetching data for {ticker}: {e}")
-
-    return pd.DataFrame(results)
-
-
 def main():
     tickers = [
         "AAPL", "MSFT"
@@ -89,4 +39,5 @@ def main():
     print_color_table_with_header(performance_df)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    with instrumentation.run(__file__):
+        main()
\ No newline at end of file
@@ -0,0 +1,134 @@
+import os
+import glob
+import json
+import uuid
+import numpy as np
+import history_store
+
+CLOSE_MATRIX_PATH = "data/closes.npy"  # float64, one row per symbol, one column per date, written as closes-<build>.npy
+CLOSE_INDEX_PATH = "data/closes.json"  # symbols and dates of the rows and columns, and the matrix file of the build
+
+
+def matrix_path(path, build):
+    # data/closes.npy -> data/closes-<build>.npy
+    root, ext = os.path.splitext(path)
+    return f"{root}-{build}{ext}"
+
+
+def build_close_matrix(conn, symbols=None, path=CLOSE_MATRIX_PATH, index_path=CLOSE_INDEX_PATH):
+    """
+    Writes the closes of `symbols` (default: every stored symbol) as an .npy
+    file that readers can memory-map, plus a JSON index.
+
+    Each build writes a new matrix file, named after the build, and the
+    index names it: replacing the index (atomically) switches readers to
+    the new matrix, so a reader never pairs a matrix with the symbols and
+    dates of another build, nor sees a half-written one. Matrices of older
+    builds are then removed; readers that mapped one keep their mapping.
+    """
+    if symbols is None:
+        symbols = sorted(history_store.stored_symbols(conn))
+    closes = history_store.load_closes(conn, symbols)
+    symbols = list(closes.columns)
+    dates = closes.index.strftime("%Y-%m-%d").tolist()
+
+    build = uuid.uuid4().hex[:12]
+    new_path = matrix_path(path, build)
+    matrix = np.lib.format.open_memmap(new_path, mode="w+", dtype=np.float64, shape=(len(symbols), len(dates)))
+    matrix[:] = closes.to_numpy(dtype=np.float64).T
+    matrix.flush()
+    del matrix
+
+    tmp_index = index_path + ".tmp"
+    with open(tmp_index, "w") as f:
+        json.dump({"build": build, "matrix": os.path.basename(new_path), "symbols": symbols, "dates": dates}, f)
+    os.replace(tmp_index, index_path)
+
+    for old in glob.glob(matrix_path(path, "*")) + [path]:  # `path` itself: layout before build ids
+        if old != new_path and os.path.exists(old):
+            try:
+                os.remove(old)
+            except OSError:
+                pass  # Still mapped by a reader (Windows)
+    print(f"✅ Close matrix: {len(symbols)} symbols x {len(dates)} dates in {new_path}")
+
+
+class CloseMatrix:
+    """
+    Read-only, memory-mapped view of the close matrix built by build_close_matrix().
+    """
+
+    def __init__(self, index_path=CLOSE_INDEX_PATH, retries=3):
+        for attempt in range(retries):
+            with open(index_path) as f:
+                index = json.load(f)
+            try:
+                matrix = np.load(os.path.join(os.path.dirname(index_path), index["matrix"]), mmap_mode="r")
+                break
+            except FileNotFoundError:
+                # Rebuilt between the two reads: the new index names the new matrix
+                if attempt == retries - 1:
+                    raise
+        self.build = index["build"]
+        self.symbols = index["symbols"]
+        self.dates = np.array(index["dates"], dtype="datetime64[D]")
+        if matrix.shape != (len(self.symbols), len(self.dates)):
+            raise ValueError(f"Close matrix {index['matrix']} does not match its index {index_path}")
+        self.rows = {sym: i for i, sym in enumerate(self.symbols)}
+        self.matrix = matrix
+
+    def __contains__(self, symbol):
+        return symbol in self.rows
+
+    def window(self, start=None):
+        # Column slice from `start`: a view, nothing is copied
+        first = 0 if start is None else int(np.searchsorted(self.dates, np.datetime64(start, "D")))
+        return slice(first, None)
+
+    def closes(self, symbol, start=None):
+        cols = self.window(start)
+        return self.dates[cols], self.matrix[self.rows[symbol], cols]
+
+    def relative(self, symbols, start=None):
+        """
+        Performance (%) of each symbol vs. its first close since `start`.
+
+        Returns:
+            dates (n,), symbols found, array (k, n) — NaN where a symbol has no bar
+        """
+        found = [s for s in symbols if s in self.rows]
+        cols = self.window(start)
+        block = self.matrix[[self.rows[s] for s in found], cols]
+        valid = ~np.isnan(block)
+        first = block[np.arange(len(found)), valid.argmax(axis=1)]
+        return self.dates[cols], found, (block / first[:, None] - 1) * 100
+
+    def last(self, symbols):
+        # Last known close of each symbol
+        found = [s for s in symbols if s in self.rows]
+        block = self.matrix[[self.rows[s] for s in found]]
+        valid = ~np.isnan(block)
+        last = block.shape[1] - 1 - valid[:, ::-1].argmax(axis=1)
+        return dict(zip(found, block[np.arange(len(found)), last]))
+
+
+def open_close_matrix(path=CLOSE_MATRIX_PATH, index_path=CLOSE_INDEX_PATH, db_path=history_store.HISTORY_DB_PATH):
+    try:
+        return CloseMatrix(index_path)
+    except (OSError, KeyError):
+        # Never built, or built before build ids
+        pass
+    conn = history_store.connect(db_path)
+    try:
+        build_close_matrix(conn, path=path, index_path=index_path)
+    finally:
+        conn.close()
+    return CloseMatrix(index_path)
+
+
+if __name__ == "__main__":
+    conn = history_store.connect()
+    try:
+        build_close_matrix(conn)
+    finally:
+        conn.close()
@@ -0,0 +1,163 @@
+import os
+import atexit
+import sqlite3
+import threading
+from contextlib import contextmanager
+import instrumentation
+
+BUSY_TIMEOUT = 30  # Seconds a statement waits for a lock held by another process
+
+# Applied to every new connection. WAL lets readers (plots, reports) run
+# while a writer (enrichment, refresh) holds the write lock; with WAL,
+# synchronous=NORMAL only syncs at checkpoints and stays crash-safe.
+PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "cache_size": -64000,  # KiB, i.e. 64 MB of page cache
+    "temp_store": "MEMORY",
+    "busy_timeout": BUSY_TIMEOUT * 1000,
+}
+
+_pool = {}  # path -> idle connections
+_open = []  # every connection created by this process
+_batches = set()  # id() of the connections inside transaction()
+_pid = os.getpid()
+_lock = threading.Lock()
+
+
+class CountingCursor(sqlite3.Cursor):
+    # Cursor of PooledConnection.cursor() (pandas read_sql/to_sql use it)
+
+    def execute(self, sql, parameters=()):
+        instrumentation.record_sqlite(self.connection.db_name, statements=1)
+        return super().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        instrumentation.record_sqlite(self.connection.db_name, statements=1)
+        return super().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        instrumentation.record_sqlite(self.connection.db_name, statements=1)
+        return super().executescript(sql_script)
+
+
+class PooledConnection(sqlite3.Connection):
+    """
+    sqlite3 connection that goes back to the pool on close(): existing
+    `try: ... finally: conn.close()` code reuses connections unchanged.
+    As with a real close, an uncommitted transaction is rolled back.
+
+    Its execute*() calls and commits are counted in the run report. The
+    count is per call, not per row: unlike a trace callback, it costs
+    nothing per row of an executemany().
+    """
+
+    def execute(self, sql, parameters=()):
+        instrumentation.record_sqlite(self.db_name, statements=1)
+        return super().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        instrumentation.record_sqlite(self.db_name, statements=1)
+        return super().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        instrumentation.record_sqlite(self.db_name, statements=1)
+        return super().executescript(sql_script)
+
+    def cursor(self, factory=CountingCursor):
+        return super().cursor(factory)
+
+    def commit(self):
+        if self.in_transaction:
+            instrumentation.record_sqlite(self.db_name, commits=1)
+        super().commit()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # `with conn:` commits without calling commit()
+        if exc_type is None and self.in_transaction:
+            instrumentation.record_sqlite(self.db_name, commits=1)
+        return super().__exit__(exc_type, exc_value, traceback)
+
+    def close(self):
+        if self.idle:
+            return
+        if self.in_transaction:
+            self.rollback()
+        with _lock:
+            self.idle = True
+            _pool.setdefault(self.pool_key, []).append(self)
+
+    def really_close(self):
+        super().close()
+
+
+def connect(path):
+    """
+    Connection to the database at `path`, reused from the pool when one is
+    idle, else opened and tuned with PRAGMAS.
+    """
+    global _pid
+    key = os.path.abspath(path)
+    with _lock:
+        if os.getpid() != _pid:
+            # Forked worker: connections of the parent must not be shared
+            _pool.clear()
+            _open.clear()
+            _pid = os.getpid()
+        idle = _pool.get(key)
+        if idle:
+            conn = idle.pop()
+            conn.idle = False
+            return conn
+
+    conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT, factory=PooledConnection, check_same_thread=False)
+    conn.pool_key = key
+    conn.db_name = os.path.basename(path)
+    conn.idle = False
+    for name, value in PRAGMAS.items():
+        conn.execute(f"PRAGMA {name} = {value}")
+    with _lock:
+        _open.append(conn)
+    return conn
+
+
+@contextmanager
+def transaction(conn):
+    """
+    Explicit write transaction: BEGIN IMMEDIATE takes the write lock up front,
+    so a batch waits (busy_timeout) instead of failing halfway with
+    "database is locked". Commits on success, rolls back on error.
+    Nested calls join the enclosing transaction: many small writes can be
+    batched into one commit by wrapping them.
+    """
+    if id(conn) in _batches:
+        yield conn
+        return
+    if conn.in_transaction:
+        conn.commit()
+    conn.execute("BEGIN IMMEDIATE")
+    _batches.add(id(conn))
+    try:
+        yield conn
+    except BaseException:
+        conn.rollback()
+        raise
+    else:
+        conn.commit()
+    finally:
+        _batches.discard(id(conn))
+
+
+def close_all():
+    with _lock:
+        conns = list(_open) if os.getpid() == _pid else []
+        _open.clear()
+        _pool.clear()
+    for conn in conns:
+        try:
+            conn.really_close()
+        except sqlite3.Error:
+            pass
+
+
+atexit.register(close_all)
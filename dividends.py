@@ -0,0 +1,131 @@
+import datetime
+import db
+import pandas as pd
+from fetch_pool import run_pool
+from market_data import get_provider
+from migrations import migrate
+
+DB_PATH = "data/tickers.db"
+TARGET_TABLE = "ticker_info"
+REQUESTS_PER_SECOND = 2  # HTTP requests per second
+REQUESTS_PER_SYMBOL = 2  # A calendar and a dividends call
+CONCURRENCY = 4
+MAX_RETRIES = 3
+
+
+def stale_dividend_symbols(conn, symbols=None, today=None):
+    """
+    Symbols whose dividend info was not checked on `today`, in one query.
+    With `symbols`, only those are considered, else the whole table.
+    """
+    today = (today or datetime.date.today()).isoformat()
+    query = f"SELECT symbol FROM {TARGET_TABLE} WHERE (last_dividend_check IS NULL OR last_dividend_check < ?)"
+    params = [today]
+    if symbols is not None:
+        symbols = list(dict.fromkeys(symbols))
+        if not symbols:
+            return []
+        query += f" AND symbol IN ({','.join('?' for _ in symbols)})"
+        params += symbols
+    return [row[0] for row in conn.execute(query, params)]
+
+
+def fetch_dividend_info(symbol, provider=None, today=None):
+    """
+    Dividend fields of one symbol. The next ex-dividend date is Yahoo's when
+    it is announced, else estimated 90 days after the last one for symbols
+    with at least 4 past dividends. Raises on error.
+    """
+    provider = provider or get_provider()
+    today = today or datetime.date.today()
+    cal = provider.calendar(symbol)
+    divs = provider.dividends(symbol)
+
+    has_dividend = not divs.empty
+    next_div_date = None
+    days_until = None
+
+    ex_date = cal.get("Ex-Dividend Date")
+    if ex_date:
+        ex_date = pd.to_datetime(ex_date).date()
+        if ex_date >= today:
+            next_div_date = ex_date.isoformat()
+            days_until = (ex_date - today).days
+    elif has_dividend and len(divs) >= 4:
+        ex_date = divs.index[-1].date() + datetime.timedelta(days=90)
+        next_div_date = ex_date.isoformat()
+        days_until = (ex_date - today).days
+
+    return {
+        "symbol": symbol,
+        "has_dividend": has_dividend,
+        "next_dividend_date": next_div_date,
+        "days_until_dividend": days_until,
+    }
+
+
+def write_dividend_info(conn, rows, today=None):
+    # Every update in a single transaction
+    today = (today or datetime.date.today()).isoformat()
+    with db.transaction(conn):
+        conn.executemany(f"""
+            UPDATE {TARGET_TABLE}
+            SET has_dividend = ?, next_dividend_date = ?, days_until_dividend = ?, last_dividend_check = ?
+            WHERE symbol = ?
+        """, [
+            (row["has_dividend"], row["next_dividend_date"], row["days_until_dividend"], today, row["symbol"])
+            for row in rows
+        ])
+
+
+def refresh_dividends(conn, symbols=None, force=False, rate=REQUESTS_PER_SECOND, concurrency=CONCURRENCY, provider=None):
+    """
+    Refreshes the dividend info of `symbols` (default: every symbol of
+    ticker_info) not checked yet today, or of all of them with `force`.
+    Fetches run concurrently under the rate limit; failed symbols are left
+    unchecked and picked up by the next run.
+
+    Returns:
+        number of symbols updated
+    """
+    migrate(conn)
+    today = datetime.date.today()
+    if force:
+        symbols = list(symbols) if symbols is not None else [row[0] for row in conn.execute(f"SELECT symbol FROM {TARGET_TABLE}")]
+    else:
+        symbols = stale_dividend_symbols(conn, symbols, today)
+    if not symbols:
+        return 0
+
+    rows = []
+
+    def on_result(symbol, row):
+        rows.append(row)
+        print(f"💰 {symbol}: has_dividend={row['has_dividend']}, next_div={row['next_dividend_date']}, in {row['days_until_dividend']}d")
+
+    def on_failure(symbol, e):
+        print(f"❌ Dividend update failed for {symbol}: {e}")
+
+    try:
+        run_pool(
+            symbols,
+            lambda s: fetch_dividend_info(s, provider=provider, today=today),
+            on_result=on_result,
+            on_failure=on_failure,
+            rate=rate,
+            concurrency=concurrency,
+            max_retries=MAX_RETRIES,
+            cost=REQUESTS_PER_SYMBOL,
+        )
+    finally:
+        write_dividend_info(conn, rows, today)
+    print(f"✅ Dividend info updated for {len(rows)}/{len(symbols)} symbols")
+    return len(rows)
+
+
+if __name__ == "__main__":
+    conn = db.connect(DB_PATH)
+    try:
+        refresh_dividends(conn)
+    finally:
+        conn.close()
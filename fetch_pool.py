@@ -0,0 +1,134 @@
+import heapq
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import instrumentation
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: `rate` tokens per second, bursts up to `capacity`.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, cost=1):
+        # Takes `cost` tokens. A cost above the capacity is taken once the
+        # bucket is full, leaving it in debt: the average rate still holds.
+        needed = min(cost, self.capacity)
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= needed:
+                    self.tokens -= cost
+                    return
+                wait_time = (needed - self.tokens) / self.rate
+            time.sleep(wait_time)
+            instrumentation.record_sleep(wait_time)
+
+
+def run_pool(items, fetch, on_result=None, on_failure=None, rate=2.0, concurrency=4,
+             max_retries=3, backoff=1.0, max_backoff=60.0, cost=1):
+    """
+    Calls fetch(item) for every item on a bounded thread pool, never exceeding
+    `rate` requests per second overall.
+
+    Params:
+        items       : iterable — e.g. list of symbols
+        fetch       : callable — raises on failure, the item is then retried
+        on_result   : callable(item, result) — called from the calling thread
+        on_failure  : callable(item, exc) — called once retries are exhausted
+        rate        : float — requests-per-second budget
+        concurrency : int  — number of requests in flight
+        max_retries : int  — retries per item before giving up
+        backoff     : float — first retry delay in seconds, doubled each attempt
+        cost        : int  — requests made by one fetch(item), e.g. 2 for info + options
+
+    Returns:
+        dict with counts of ok, failed and retried calls
+    """
+    bucket = TokenBucket(rate)
+    pending = list(reversed(list(items)))
+    retry_heap = []  # (ready_at, seq, item, attempt)
+    in_flight = {}
+    stats = {"ok": 0, "failed": 0, "retried": 0}
+    seq = 0
+
+    def call(item):
+        bucket.acquire(cost)
+        return fetch(item)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        while pending or retry_heap or in_flight:
+            # Fill free slots, ready retries first so they don't starve
+            now = time.monotonic()
+            while len(in_flight) < concurrency:
+                if retry_heap and retry_heap[0][0] <= now:
+                    _, _, item, attempt = heapq.heappop(retry_heap)
+                elif pending:
+                    item, attempt = pending.pop(), 0
+                else:
+                    break
+                in_flight[executor.submit(call, item)] = (item, attempt)
+
+            if not in_flight:
+                # Only delayed retries left: sleep until the first one is due
+                delay = max(0.0, retry_heap[0][0] - time.monotonic())
+                time.sleep(delay)
+                instrumentation.record_sleep(delay)
+                continue
+
+            timeout = None
+            if retry_heap:
+                timeout = max(0.0, retry_heap[0][0] - time.monotonic())
+            done, _ = wait(in_flight, timeout=timeout, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                item, attempt = in_flight.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    if attempt < max_retries:
+                        delay = min(max_backoff, backoff * 2 ** attempt) * random.uniform(0.8, 1.2)
+                        seq += 1
+                        heapq.heappush(retry_heap, (time.monotonic() + delay, seq, item, attempt + 1))
+                        stats["retried"] += 1
+                    else:
+                        stats["failed"] += 1
+                        if on_failure:
+                            on_failure(item, e)
+                    continue
+                stats["ok"] += 1
+                if on_result:
+                    on_result(item, result)
+
+    return stats
+
+
+def benchmark(n=200, rate=50.0, concurrency=8, latency=0.05, failure_rate=0.05):
+    from importlib import import_module
+    from market_data import FakeProvider
+    enrich = import_module("02-enrich_tickers_with_yfinance")
+    provider = FakeProvider(latency=latency, failure_rate=failure_rate)
+
+    symbols = [f"T{i:05d}" for i in range(n)]
+    start = time.perf_counter()
+    stats = run_pool(
+        symbols, lambda s: enrich.fetch_ticker_info(s, provider=provider),
+        rate=rate, concurrency=concurrency, backoff=0.05,
+    )
+    elapsed = time.perf_counter() - start
+    print(f"{n} symbols in {elapsed:.2f}s ({n / elapsed:.1f}/s) — {stats}")
+    return stats
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,340 @@
+import os
+import glob
+import time
+import sqlite3
+import db
+import pandas as pd
+from market_data import get_provider
+
+HISTORY_DB_PATH = "data/history.db"
+HISTORY_TABLE = "history"
+LEGACY_BASE_PATH = "./ticker_dbs"
+
+COLUMNS = ["open", "high", "low", "close", "volume"]
+ADJUSTMENT_TOLERANCE = 1e-4  # Relative change of an already stored close that means "re-adjusted"
+
+
+def init_history_table(conn):
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {HISTORY_TABLE} (
+            symbol TEXT NOT NULL,
+            date TEXT NOT NULL,
+            open REAL,
+            high REAL,
+            low REAL,
+            close REAL,
+            volume INTEGER,
+            etf TEXT,
+            PRIMARY KEY (symbol, date)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS refresh_log (
+            symbol TEXT PRIMARY KEY,
+            refreshed_at REAL
+        )
+    """)
+    conn.commit()
+
+
+def connect(db_path=HISTORY_DB_PATH):
+    conn = db.connect(db_path)
+    init_history_table(conn)
+    return conn
+
+
+def _rows(symbol, df, etf):
+    # df: one row per bar, OHLCV columns in any case, dates in the index or a Date column
+    df = df.copy()
+    df.columns = [str(c).lower() for c in df.columns]
+    if "date" in df.columns:
+        df = df.set_index("date")
+    dates = pd.to_datetime(df.index)
+    if dates.tz is not None:
+        dates = dates.tz_localize(None)
+    df.index = dates.strftime("%Y-%m-%d")
+    df = df.dropna(subset=["close"])
+    for col in COLUMNS:
+        if col not in df.columns:
+            df[col] = None
+    return [
+        (symbol, date, o, h, l, c, None if pd.isna(v) else int(v), etf)
+        for date, o, h, l, c, v in df[COLUMNS].itertuples(name=None)
+    ]
+
+
+def save_history(conn, symbol, df, etf=None):
+    """
+    Replaces the stored bars of `symbol` with `df`, in one transaction.
+    Returns the number of bars written.
+    """
+    if etf is None:
+        # Keep the ETF recorded by an earlier save
+        row = conn.execute(f"SELECT etf FROM {HISTORY_TABLE} WHERE symbol = ? AND etf IS NOT NULL LIMIT 1", (symbol,)).fetchone()
+        etf = row[0] if row else None
+    rows = _rows(symbol, df, etf)
+    with db.transaction(conn):
+        conn.execute(f"DELETE FROM {HISTORY_TABLE} WHERE symbol = ?", (symbol,))
+        conn.executemany(f"""
+            INSERT INTO {HISTORY_TABLE} (symbol, date, open, high, low, close, volume, etf)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, rows)
+    return len(rows)
+
+
+def append_history(conn, symbol, df, etf=None):
+    """
+    Inserts or overwrites the bars of `df`, leaving older bars untouched.
+    Safe to replay: the same bars written twice give the same table.
+    """
+    rows = _rows(symbol, df, etf)
+    with db.transaction(conn):
+        conn.executemany(f"""
+            INSERT INTO {HISTORY_TABLE} (symbol, date, open, high, low, close, volume, etf)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (symbol, date) DO UPDATE SET
+                open = excluded.open, high = excluded.high, low = excluded.low,
+                close = excluded.close, volume = excluded.volume,
+                etf = COALESCE(excluded.etf, etf)
+        """, rows)
+    return len(rows)
+
+
+def last_stored_bars(conn, symbol, count=2):
+    # Most recent (date, close) pairs, newest first
+    return conn.execute(f"""
+        SELECT date, close FROM {HISTORY_TABLE}
+        WHERE symbol = ?
+        ORDER BY date DESC
+        LIMIT ?
+    """, (symbol, count)).fetchall()
+
+
+def mark_refreshed(conn, symbols, when=None):
+    when = time.time() if when is None else when
+    with db.transaction(conn):
+        conn.executemany(
+            "INSERT OR REPLACE INTO refresh_log (symbol, refreshed_at) VALUES (?, ?)",
+            [(symbol, when) for symbol in symbols]
+        )
+
+
+def refreshed_at(conn, symbols):
+    # Time of the last refresh of each symbol, missing when never refreshed
+    symbols = list(symbols)
+    if not symbols:
+        return {}
+    placeholders = ",".join("?" for _ in symbols)
+    return dict(conn.execute(
+        f"SELECT symbol, refreshed_at FROM refresh_log WHERE symbol IN ({placeholders})", symbols
+    ).fetchall())
+
+
+def is_adjusted(df, anchor_date, anchor_close):
+    """
+    True when the bars fetched from `anchor_date` disagree with the stored
+    close of that day, or carry a new dividend or split: yfinance then has
+    re-adjusted every past price.
+    """
+    dates = df.index.tz_localize(None) if df.index.tz is not None else df.index
+    fetched = df["Close"][dates.strftime("%Y-%m-%d") == anchor_date]
+    if fetched.empty or abs(fetched.iloc[0] - anchor_close) > ADJUSTMENT_TOLERANCE * abs(anchor_close):
+        return True
+    for action in ("Dividends", "Stock Splits"):
+        if action in df.columns and (df[action].iloc[1:] != 0).any():
+            return True
+    return False
+
+
+def tag_etf(conn, symbol, etf):
+    # Sector ETF of the stored bars not tagged yet
+    with db.transaction(conn):
+        conn.execute(f"UPDATE {HISTORY_TABLE} SET etf = ? WHERE symbol = ? AND etf IS NULL", (etf, symbol))
+
+
+def refresh_history(conn, symbol, etf=None, period="1y", provider=None, fresh_since=None):
+    """
+    Brings the stored bars of `symbol` up to date, fetching only what is missing.
+    With `fresh_since` (epoch seconds, e.g. the close of the last session),
+    a symbol refreshed since then (refresh_log) is not fetched at all.
+
+    The request starts at the last-but-one stored bar: its close, final by
+    now, is compared with the one just fetched. A difference means that a
+    split or a dividend re-adjusted past prices, and the whole `period` is
+    pulled again. The last stored bar is always rewritten, as it may have
+    been saved while the market was open.
+
+    Returns:
+        (mode, count) with mode in "full", "incremental", "fresh" or "none"
+    """
+    if fresh_since is not None and refreshed_at(conn, [symbol]).get(symbol, 0) >= fresh_since:
+        if etf is not None:
+            tag_etf(conn, symbol, etf)
+        return "fresh", 0
+
+    provider = provider or get_provider()
+    bars = last_stored_bars(conn, symbol)
+    if not bars:
+        df = provider.history(symbol, period=period)
+        mark_refreshed(conn, [symbol])
+        if df.empty:
+            return "none", 0
+        return "full", save_history(conn, symbol, df, etf)
+
+    anchor_date, anchor_close = bars[-1]
+    df = provider.history(symbol, start=anchor_date)
+    mark_refreshed(conn, [symbol])
+    if df.empty:
+        return "none", 0
+
+    if is_adjusted(df, anchor_date, anchor_close):
+        print(f"↻ {symbol}: price adjustment detected, full refresh")
+        df = provider.history(symbol, period=period)
+        return "full", save_history(conn, symbol, df, etf)
+
+    return "incremental", append_history(conn, symbol, df, etf)
+
+
+def _split_wide(wide, symbol):
+    if wide.empty or symbol not in wide.columns.get_level_values(1):
+        return pd.DataFrame()
+    return wide.xs(symbol, axis=1, level=1).dropna(how="all")
+
+
+def refresh_many(conn, symbols, period="1y", provider=None, chunk_size=200):
+    """
+    refresh_history() for many symbols, with multi-symbol downloads: one for
+    the missing bars of every stored symbol, one for the full pulls.
+
+    Returns:
+        dict symbol -> mode ("full", "incremental" or "none")
+    """
+    provider = provider or get_provider()
+    modes = {}
+    anchors = {}
+    full = []
+    for symbol in dict.fromkeys(symbols):
+        bars = last_stored_bars(conn, symbol)
+        if bars:
+            anchors[symbol] = bars[-1]
+        else:
+            full.append(symbol)
+
+    stored = list(anchors)
+    for i in range(0, len(stored), chunk_size):
+        chunk = stored[i:i + chunk_size]
+        start = min(anchors[s][0] for s in chunk)
+        wide = provider.download(chunk, start=start)
+        for symbol in chunk:
+            anchor_date, anchor_close = anchors[symbol]
+            df = _split_wide(wide, symbol)
+            if not df.empty:
+                df = df[df.index >= pd.Timestamp(anchor_date)]
+            if df.empty:
+                modes[symbol] = "none"
+            elif is_adjusted(df, anchor_date, anchor_close):
+                print(f"↻ {symbol}: price adjustment detected, full refresh")
+                full.append(symbol)
+            else:
+                append_history(conn, symbol, df)
+                modes[symbol] = "incremental"
+
+    for i in range(0, len(full), chunk_size):
+        chunk = full[i:i + chunk_size]
+        wide = provider.download(chunk, period=period)
+        for symbol in chunk:
+            df = _split_wide(wide, symbol)
+            if df.empty:
+                modes[symbol] = "none"
+            else:
+                save_history(conn, symbol, df)
+                modes[symbol] = "full"
+
+    mark_refreshed(conn, list(dict.fromkeys(symbols)))
+    return modes
+
+
+def load_history(conn, symbol, start=None, end=None):
+    """
+    Bars of one symbol, as a frame indexed by Date with OHLCV columns.
+    """
+    query = f"SELECT date, open, high, low, close, volume FROM {HISTORY_TABLE} WHERE symbol = ?"
+    params = [symbol]
+    if start is not None:
+        query += " AND date >= ?"
+        params.append(pd.Timestamp(start).strftime("%Y-%m-%d"))
+    if end is not None:
+        query += " AND date <= ?"
+        params.append(pd.Timestamp(end).strftime("%Y-%m-%d"))
+    df = pd.read_sql(query + " ORDER BY date", conn, params=params, parse_dates=["date"])
+    df.columns = ["Date", "Open", "High", "Low", "Close", "Volume"]
+    return df.set_index("Date")
+
+
+def load_closes(conn, symbols, start=None, end=None):
+    """
+    Closes of `symbols` between `start` and `end`, read with one query, as
+    one aligned frame: dates x symbols, NaN where a symbol has no bar.
+    Symbols without any stored bar are left out.
+    """
+    symbols = list(dict.fromkeys(symbols))
+    if not symbols:
+        return pd.DataFrame()
+    placeholders = ",".join("?" for _ in symbols)
+    query = f"SELECT symbol, date, close FROM {HISTORY_TABLE} WHERE symbol IN ({placeholders})"
+    params = list(symbols)
+    if start is not None:
+        query += " AND date >= ?"
+        params.append(pd.Timestamp(start).strftime("%Y-%m-%d"))
+    if end is not None:
+        query += " AND date <= ?"
+        params.append(pd.Timestamp(end).strftime("%Y-%m-%d"))
+    df = pd.read_sql(query, conn, params=params)
+    if df.empty:
+        return pd.DataFrame()
+    closes = df.pivot(index="date", columns="symbol", values="close")
+    closes.index = pd.to_datetime(closes.index).rename("Date")
+    return closes[[s for s in symbols if s in closes.columns]].sort_index()
+
+
+def read_closes(symbols, start=None, end=None, db_path=HISTORY_DB_PATH):
+    conn = connect(db_path)
+    try:
+        return load_closes(conn, symbols, start, end)
+    finally:
+        conn.close()
+
+
+def stored_symbols(conn):
+    return [row[0] for row in conn.execute(f"SELECT DISTINCT symbol FROM {HISTORY_TABLE}")]
+
+
+def import_ticker_dbs(conn, base_path=LEGACY_BASE_PATH):
+    """
+    One-shot migration of the former per-symbol files, ticker_dbs/<TICKER>.db.
+    """
+    imported = 0
+    for db_path in sorted(glob.glob(os.path.join(base_path, "*.db"))):
+        symbol = os.path.splitext(os.path.basename(db_path))[0]
+        try:
+            with sqlite3.connect(db_path) as legacy:
+                df = pd.read_sql("SELECT * FROM history", legacy)
+        except Exception as e:
+            print(f"Skipping {db_path}: {e}")
+            continue
+        if df.empty:
+            continue
+        etf = df["ETF"].iloc[-1] if "ETF" in df.columns else None
+        df = df.drop(columns=[c for c in ("Ticker", "ETF") if c in df.columns])
+        save_history(conn, symbol, df, etf)
+        imported += 1
+    print(f"Imported {imported} symbols from {base_path} into {HISTORY_DB_PATH}")
+    return imported
+
+
+if __name__ == "__main__":
+    conn = connect()
+    try:
+        import_ticker_dbs(conn)
+    finally:
+        conn.close()
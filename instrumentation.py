@@ -0,0 +1,146 @@
+import os
+import json
+import time
+import datetime
+import threading
+from contextlib import contextmanager
+
+REPORT_DIR = "data/run_reports"  # One JSON run report per script run
+
+_lock = threading.Lock()
+
+
+def _empty_report():
+    return {
+        "stages": {},  # name -> runs, wall and CPU seconds
+        "provider_calls": {},  # endpoint -> calls, failures, seconds (summed over threads)
+        "caches": {},  # name -> hits, misses
+        "sqlite": {},  # database file -> statements (execute calls), commits
+        "sleep_seconds": 0.0,  # rate limiting and retry waits, summed over threads
+    }
+
+
+_report = _empty_report()
+
+
+def reset():
+    global _report
+    with _lock:
+        _report = _empty_report()
+
+
+@contextmanager
+def stage(name):
+    """
+    Adds the wall and CPU time of the block to stage `name`. Stages may
+    nest: the time of an inner stage also counts in the outer one. CPU time
+    is the process's, all threads included.
+    """
+    wall, cpu = time.perf_counter(), time.process_time()
+    try:
+        yield
+    finally:
+        wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+        with _lock:
+            entry = _report["stages"].setdefault(name, {"runs": 0, "wall_seconds": 0.0, "cpu_seconds": 0.0})
+            entry["runs"] += 1
+            entry["wall_seconds"] += wall
+            entry["cpu_seconds"] += cpu
+
+
+def record_call(endpoint, seconds, failed=False):
+    # One market data request (see market_data.InstrumentedProvider)
+    with _lock:
+        entry = _report["provider_calls"].setdefault(endpoint, {"calls": 0, "failures": 0, "seconds": 0.0})
+        entry["calls"] += 1
+        entry["failures"] += int(failed)
+        entry["seconds"] += seconds
+
+
+def record_cache(cache, hits=0, misses=0):
+    with _lock:
+        entry = _report["caches"].setdefault(cache, {"hits": 0, "misses": 0})
+        entry["hits"] += hits
+        entry["misses"] += misses
+
+
+def record_sleep(seconds):
+    with _lock:
+        _report["sleep_seconds"] += seconds
+
+
+def record_sqlite(database, statements=0, commits=0):
+    # Counted per execute*() call by db.PooledConnection: an executemany()
+    # of many rows is one statement
+    with _lock:
+        entry = _report["sqlite"].setdefault(database, {"statements": 0, "commits": 0})
+        entry["statements"] += statements
+        entry["commits"] += commits
+
+
+def snapshot():
+    # Copy of the counters, with the cache hit ratios
+    with _lock:
+        report = json.loads(json.dumps(_report))
+    for entry in report["caches"].values():
+        total = entry["hits"] + entry["misses"]
+        entry["hit_ratio"] = round(entry["hits"] / total, 4) if total else None
+    return report
+
+
+def print_summary(report):
+    print(f"\n⏱️ {report['script']}: {report['wall_seconds']:.1f}s wall, {report['cpu_seconds']:.1f}s CPU")
+    for name, entry in report["stages"].items():
+        print(f"   stage    {name:<28} {entry['wall_seconds']:8.2f}s wall {entry['cpu_seconds']:8.2f}s CPU"
+              + (f"  ({entry['runs']} runs)" if entry["runs"] > 1 else ""))
+    for endpoint, entry in sorted(report["provider_calls"].items()):
+        print(f"   provider {endpoint:<28} {entry['calls']:8d} calls {entry['seconds']:8.2f}s"
+              + (f"  ({entry['failures']} failed)" if entry["failures"] else ""))
+    for cache, entry in sorted(report["caches"].items()):
+        ratio = "--" if entry["hit_ratio"] is None else f"{entry['hit_ratio']:.0%}"
+        print(f"   cache    {cache:<28} {ratio:>8} hits ({entry['hits']} / {entry['hits'] + entry['misses']})")
+    for name, entry in sorted(report["sqlite"].items()):
+        print(f"   sqlite   {name:<28} {entry['statements']:8d} statements, {entry['commits']} commits")
+    if report["sleep_seconds"]:
+        print(f"   sleep    {'rate limits, all threads':<28} {report['sleep_seconds']:8.2f}s")
+
+
+@contextmanager
+def run(script, report_dir=REPORT_DIR):
+    """
+    Instruments a whole script run: counters start from zero, and at the
+    end a JSON run report is written to `report_dir` and summarized on the
+    terminal, also when the run fails.
+
+        if __name__ == "__main__":
+            with instrumentation.run(__file__):
+                main()
+    """
+    reset()
+    name = os.path.splitext(os.path.basename(script))[0]
+    started = datetime.datetime.now()
+    wall, cpu = time.perf_counter(), time.process_time()
+    status = "failed"
+    try:
+        yield
+        status = "ok"
+    finally:
+        report = {
+            "script": name,
+            "status": status,
+            "started_at": started.isoformat(timespec="seconds"),
+            "wall_seconds": time.perf_counter() - wall,
+            "cpu_seconds": time.process_time() - cpu,
+            **snapshot(),
+        }
+        try:
+            os.makedirs(report_dir, exist_ok=True)
+            path = os.path.join(report_dir, f"{name}-{started:%Y%m%dT%H%M%S}.json")
+            with open(path, "w") as f:
+                json.dump(report, f, indent=2)
+        except OSError as e:
+            path = None
+            print(f"⚠️ Run report not written: {e}")
+        print_summary(report)
+        if path:
+            print(f"   report   {path}")
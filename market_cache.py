@@ -0,0 +1,250 @@
+import time
+import datetime
+from zoneinfo import ZoneInfo
+from market_data import slice_history
+import db
+import history_store
+import instrumentation
+from migrations import migrate
+
+MARKET_TZ = ZoneInfo("America/New_York")
+MARKET_CLOSE = datetime.time(16, 0)
+MARKET_OPEN = datetime.time(9, 30)
+
+# Max age (seconds) of a cached value while the market is open. When it is
+# closed, a value is valid for as long as no new session has completed.
+CACHE_TTL = {
+    "return": 6 * 3600,
+    "price": 15 * 60,
+    "bars": 15 * 60,
+}
+BARS_PERIOD = "2y"  # Depth of the daily bars kept per symbol, enough for every horizon
+KEEP_SESSIONS = 5  # Sessions kept in price_cache, older rows are evicted
+
+CACHE_COLUMNS = {"return": "return_pct", "price": "close_price"}
+
+
+def _nth_weekday(year, month, weekday, n):
+    # n-th `weekday` (0=Monday) of the month, n=-1 for the last one
+    if n > 0:
+        first = datetime.date(year, month, 1)
+        return first + datetime.timedelta(days=(weekday - first.weekday()) % 7 + 7 * (n - 1))
+    last = datetime.date(year + month // 12, month % 12 + 1, 1) - datetime.timedelta(days=1)
+    return last - datetime.timedelta(days=(last.weekday() - weekday) % 7)
+
+
+def _easter(year):
+    # Anonymous Gregorian algorithm
+    a, b, c = year % 19, year // 100, year % 100
+    d, e = b // 4, b % 4
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = c // 4, c % 4
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month = (h + l - 7 * m + 114) // 31
+    day = (h + l - 7 * m + 114) % 31 + 1
+    return datetime.date(year, month, day)
+
+
+def _observed(day):
+    if day.weekday() == 5:
+        return day - datetime.timedelta(days=1)
+    if day.weekday() == 6:
+        return day + datetime.timedelta(days=1)
+    return day
+
+
+def nyse_holidays(year):
+    holidays = {
+        _nth_weekday(year, 1, 0, 3),   # Martin Luther King Jr. Day
+        _nth_weekday(year, 2, 0, 3),   # Washington's Birthday
+        _easter(year) - datetime.timedelta(days=2),  # Good Friday
+        _nth_weekday(year, 5, 0, -1),  # Memorial Day
+        _observed(datetime.date(year, 7, 4)),
+        _nth_weekday(year, 9, 0, 1),   # Labor Day
+        _nth_weekday(year, 11, 3, 4),  # Thanksgiving
+        _observed(datetime.date(year, 12, 25)),
+    }
+    new_year = datetime.date(year, 1, 1)
+    if new_year.weekday() != 5:  # Not moved back to December 31st
+        holidays.add(_observed(new_year))
+    if year >= 2022:
+        holidays.add(_observed(datetime.date(year, 6, 19)))  # Juneteenth
+    return holidays
+
+
+def is_trading_day(day):
+    return day.weekday() < 5 and day not in nyse_holidays(day.year)
+
+
+def _market_now(now=None):
+    if now is None:
+        return datetime.datetime.now(MARKET_TZ)
+    if now.tzinfo is None:
+        now = now.astimezone()
+    return now.astimezone(MARKET_TZ)
+
+
+def last_completed_session(now=None):
+    """
+    Date of the last NYSE session that has closed at `now` (default: now).
+    On a Saturday, a Sunday or a holiday, it is the previous trading day.
+    """
+    now = _market_now(now)
+    day = now.date()
+    if not (is_trading_day(day) and now.time() >= MARKET_CLOSE):
+        day -= datetime.timedelta(days=1)
+        while not is_trading_day(day):
+            day -= datetime.timedelta(days=1)
+    return day
+
+
+def is_market_open(now=None):
+    now = _market_now(now)
+    return is_trading_day(now.date()) and MARKET_OPEN <= now.time() < MARKET_CLOSE
+
+
+def init_cache_table(conn):
+    # price_cache is created and upgraded by the tickers.db migrations
+    migrate(conn)
+    compact_price_cache(conn)
+
+
+def compact_price_cache(conn, keep_sessions=KEEP_SESSIONS):
+    # Evict rows of sessions older than the last `keep_sessions` ones
+    day = last_completed_session()
+    for _ in range(keep_sessions - 1):
+        day -= datetime.timedelta(days=1)
+        while not is_trading_day(day):
+            day -= datetime.timedelta(days=1)
+    cur = conn.execute("DELETE FROM price_cache WHERE last_updated < ?", (day.isoformat(),))
+    conn.commit()
+    return cur.rowcount
+
+
+def cache_get(conn, symbol, period, kind, now=None):
+    """
+    Cached value of `kind` ("return" or "price") if still valid, else None.
+    `last_updated` holds the session the value belongs to, not the fetch day.
+    """
+    column = CACHE_COLUMNS[kind]
+    session = last_completed_session(now).isoformat()
+    row = conn.execute(f"""
+        SELECT {column}, fetched_at FROM price_cache
+        WHERE symbol = ? AND period = ? AND last_updated = ?
+    """, (symbol, period, session)).fetchone()
+    if not row or row[0] is None:
+        instrumentation.record_cache("price_cache", misses=1)
+        return None
+    value, fetched_at = row
+    if is_market_open(now) and (fetched_at is None or time.time() - fetched_at > CACHE_TTL[kind]):
+        instrumentation.record_cache("price_cache", misses=1)
+        return None
+    instrumentation.record_cache("price_cache", hits=1)
+    return value
+
+
+def cache_put(conn, symbol, period, kind, value, now=None):
+    column = CACHE_COLUMNS[kind]
+    session = last_completed_session(now).isoformat()
+    # Part of the caller's batch when inside db.transaction()
+    with db.transaction(conn):
+        conn.execute(f"""
+            INSERT INTO price_cache (symbol, period, {column}, last_updated, fetched_at)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (symbol, period, last_updated)
+            DO UPDATE SET {column} = excluded.{column}, fetched_at = excluded.fetched_at
+        """, (symbol, period, value, session, time.time()))
+
+
+_bars_conn = None
+
+
+def bars_connection():
+    # Daily bars live in the history store (data/history.db)
+    global _bars_conn
+    if _bars_conn is None:
+        _bars_conn = history_store.connect()
+    return _bars_conn
+
+
+def session_close(day):
+    return datetime.datetime.combine(day, MARKET_CLOSE, tzinfo=MARKET_TZ).timestamp()
+
+
+def ensure_daily_bars(symbols, conn=None, now=None):
+    """
+    Makes sure the daily bars of `symbols` include the last completed
+    session. Only symbols not refreshed since that session closed are
+    fetched, in one batched, incremental request.
+    """
+    conn = conn or bars_connection()
+    symbols = list(dict.fromkeys(symbols))
+    done = history_store.refreshed_at(conn, symbols)
+    close = session_close(last_completed_session(now))
+    market_open = is_market_open(now)
+    stale = [
+        s for s in symbols
+        if s not in done or done[s] < close
+        or (market_open and time.time() - done[s] > CACHE_TTL["bars"])
+    ]
+    instrumentation.record_cache("bars", hits=len(symbols) - len(stale), misses=len(stale))
+    if stale:
+        history_store.refresh_many(conn, stale, period=BARS_PERIOD)
+    return stale
+
+
+def daily_bars(symbol, conn=None):
+    ensure_daily_bars([symbol], conn)
+    return history_store.load_history(conn or bars_connection(), symbol)
+
+
+def daily_closes(symbols, start=None, conn=None):
+    # Aligned closes (dates x symbols), refreshed first when needed
+    ensure_daily_bars(symbols, conn)
+    return history_store.load_closes(conn or bars_connection(), symbols, start=start)
+
+
+def get_or_fetch_return(symbol, period, conn):
+    # Step 1: check cache
+    cached = cache_get(conn, symbol, period, "return")
+    if cached is not None:
+        return cached
+
+    # Step 2: compute from the daily bars
+    try:
+        hist = slice_history(daily_bars(symbol), period=period)
+        if hist.empty or len(hist) < 2:
+            return None
+        ret = (hist["Close"].iloc[-1] - hist["Close"].iloc[0]) / hist["Close"].iloc[0]
+        return_pct = round(float(ret), 4)
+    except Exception as e:
+        print(f"⚠️ Failed to get return for {symbol}: {e}")
+        return None
+
+    # Step 3: insert into cache
+    cache_put(conn, symbol, period, "return", return_pct)
+    return return_pct
+
+
+def get_or_fetch_price(symbol, conn):
+    # Step 1: check cache
+    cached = cache_get(conn, symbol, "1d", "price")
+    if cached is not None:
+        return round(cached, 2)
+
+    # Step 2: last close of the daily bars
+    try:
+        data = daily_bars(symbol)
+        if data.empty:
+            return None
+        price = round(float(data["Close"].iloc[-1]), 2)
+    except Exception as e:
+        print(f"⚠️ Failed to get last price for {symbol}: {e}")
+        return None
+
+    # Step 3: store in cache
+    cache_put(conn, symbol, "1d", "price", price)
+    return price
@@ -0,0 +1,498 @@
+import os
+import time
+import random
+import datetime
+import functools
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+import instrumentation
+
+PROVIDER_ENV = "TICKERS_PROVIDER"  # yfinance (default), record, replay or fake
+FIXTURES_ENV = "TICKERS_FIXTURES"
+FIXTURES_DIR = "fixtures"
+FAKE_ORIGIN = "2015-01-01"
+
+OptionChain = namedtuple("OptionChain", ["calls", "puts"])
+
+
+class FixtureNotFound(KeyError):
+    pass
+
+
+def period_start(period, last):
+    """
+    First date covered by a yfinance-style `period` ("5d", "6mo", "1y", "ytd", ...)
+    ending at `last`. None means the whole history.
+    """
+    if period is None or period == "max":
+        return None
+    if period == "ytd":
+        return pd.Timestamp(last.year, 1, 1, tz=last.tz)
+    if period.endswith("mo"):
+        return last - pd.DateOffset(months=int(period[:-2]))
+    if period.endswith("y"):
+        return last - pd.DateOffset(years=int(period[:-1]))
+    if period.endswith("wk"):
+        return last - pd.DateOffset(weeks=int(period[:-2]))
+    if period.endswith("d"):
+        return last - pd.DateOffset(days=int(period[:-1]))
+    raise ValueError(f"Unsupported period '{period}'")
+
+
+def slice_history(df, period=None, start=None, end=None):
+    if df.empty:
+        return df
+    index = df.index
+    if period is not None and start is None:
+        if period.endswith("d") and period[:-1].isdigit():
+            # yfinance returns the last N trading days ("ytd" is a calendar period)
+            return df.iloc[-int(period[:-1]):]
+        first = period_start(period, index[-1])
+        return df if first is None else df[index > first]
+    mask = np.ones(len(df), dtype=bool)
+    if start is not None:
+        mask &= index >= _as_index_tz(start, index)
+    if end is not None:
+        mask &= index < _as_index_tz(end, index)
+    return df[mask]
+
+
+def _as_index_tz(value, index):
+    ts = pd.Timestamp(value)
+    if index.tz is not None and ts.tz is None:
+        return ts.tz_localize(index.tz)
+    if index.tz is None and ts.tz is not None:
+        return ts.tz_localize(None)
+    return ts
+
+
+def to_wide(frames):
+    """
+    Assembles {symbol: OHLCV frame} into the yf.download layout:
+    columns (field, symbol), tz-naive dates.
+    """
+    frames = {sym: df for sym, df in frames.items() if df is not None and not df.empty}
+    if not frames:
+        return pd.DataFrame()
+    parts = {}
+    for sym, df in frames.items():
+        df = df.copy()
+        if df.index.tz is not None:
+            df.index = df.index.tz_localize(None)
+        df.index = df.index.normalize()
+        parts[sym] = df
+    wide = pd.concat(parts, axis=1).swaplevel(0, 1, axis=1).sort_index(axis=1)
+    wide.columns.names = ["Price", "Ticker"]
+    return wide
+
+
+class MarketDataProvider:
+    """
+    Everything the scripts need from a market-data source. Method names and
+    return types follow yfinance, so code written against yf.Ticker keeps working.
+    """
+
+    def info(self, symbol):
+        raise NotImplementedError
+
+    def quote(self, symbol):
+        # Subset of info(): symbol, marketCap, quoteType, currency, lastPrice
+        raise NotImplementedError
+
+    def options(self, symbol):
+        raise NotImplementedError
+
+    def history(self, symbol, period=None, start=None, end=None, interval="1d"):
+        raise NotImplementedError
+
+    def download(self, symbols, period=None, start=None, end=None, interval="1d"):
+        raise NotImplementedError
+
+    def dividends(self, symbol):
+        raise NotImplementedError
+
+    def calendar(self, symbol):
+        raise NotImplementedError
+
+    def option_chain(self, symbol, expiry):
+        raise NotImplementedError
+
+
+class YFinanceProvider(MarketDataProvider):
+
+    def __init__(self):
+        import yfinance as yf
+        self.yf = yf
+
+    def info(self, symbol):
+        return self.yf.Ticker(symbol).info
+
+    def quote(self, symbol):
+        # fast_info: market_cap costs a shares request and a history request
+        # (shares x last price), and falls back to .info when shares are missing
+        fast = self.yf.Ticker(symbol).fast_info
+        return {
+            "symbol": symbol,
+            "marketCap": fast.market_cap,
+            "quoteType": fast.quote_type,
+            "currency": fast.currency,
+            "lastPrice": fast.last_price,
+        }
+
+    def options(self, symbol):
+        return tuple(self.yf.Ticker(symbol).options)
+
+    def history(self, symbol, period=None, start=None, end=None, interval="1d"):
+        if period is None and start is None:
+            period = "1mo"
+        return self.yf.Ticker(symbol).history(period=period, start=start, end=end, interval=interval)
+
+    def download(self, symbols, period=None, start=None, end=None, interval="1d"):
+        if period is None and start is None:
+            period = "1mo"
+        return self.yf.download(
+            list(symbols), period=period, start=start, end=end, interval=interval,
+            auto_adjust=True, group_by="column", progress=False, multi_level_index=True,
+        )
+
+    def dividends(self, symbol):
+        return self.yf.Ticker(symbol).dividends
+
+    def calendar(self, symbol):
+        return self.yf.Ticker(symbol).calendar
+
+    def option_chain(self, symbol, expiry):
+        chain = self.yf.Ticker(symbol).option_chain(expiry)
+        return OptionChain(chain.calls, chain.puts)
+
+
+class ReplayProvider(MarketDataProvider):
+    """
+    Serves data previously saved by RecordingProvider from `fixtures_dir`,
+    without any network access. Histories are stored once per symbol and
+    sliced on demand, so date-relative requests keep working on later days.
+    """
+
+    def __init__(self, fixtures_dir=FIXTURES_DIR):
+        self.fixtures_dir = fixtures_dir
+
+    def _path(self, kind, *parts):
+        name = "_".join(str(p).replace("/", "-") for p in parts)
+        return os.path.join(self.fixtures_dir, kind, f"{name}.pkl")
+
+    def _load(self, kind, *parts):
+        path = self._path(kind, *parts)
+        if not os.path.exists(path):
+            raise FixtureNotFound(f"No recorded {kind} for {', '.join(map(str, parts))} in {self.fixtures_dir}")
+        return pd.read_pickle(path)
+
+    def info(self, symbol):
+        return self._load("info", symbol)
+
+    def quote(self, symbol):
+        return self._load("quote", symbol)
+
+    def options(self, symbol):
+        return self._load("options", symbol)
+
+    def history(self, symbol, period=None, start=None, end=None, interval="1d"):
+        if period is None and start is None:
+            period = "1mo"
+        return slice_history(self._load("history", symbol, interval), period, start, end)
+
+    def download(self, symbols, period=None, start=None, end=None, interval="1d"):
+        frames = {}
+        for sym in symbols:
+            try:
+                frames[sym] = self.history(sym, period=period, start=start, end=end, interval=interval)
+            except FixtureNotFound:
+                pass
+        return to_wide(frames)
+
+    def dividends(self, symbol):
+        return self._load("dividends", symbol)
+
+    def calendar(self, symbol):
+        return self._load("calendar", symbol)
+
+    def option_chain(self, symbol, expiry):
+        return OptionChain(*self._load("option_chain", symbol, expiry))
+
+
+class RecordingProvider(ReplayProvider):
+    """
+    Forwards every call to `inner` (yfinance by default) and saves the answers
+    as fixtures that ReplayProvider can serve later.
+    """
+
+    def __init__(self, inner=None, fixtures_dir=FIXTURES_DIR):
+        super().__init__(fixtures_dir)
+        self.inner = inner or YFinanceProvider()
+
+    def _save(self, value, kind, *parts):
+        path = self._path(kind, *parts)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        pd.to_pickle(value, path)
+        return value
+
+    def _save_history(self, df, symbol, interval):
+        # Merge with what was recorded before: one fixture covers every window
+        if df is None or df.empty:
+            return
+        try:
+            old = self._load("history", symbol, interval)
+            if old.index.tz != df.index.tz:
+                old.index = old.index.tz_localize(None) if df.index.tz is None else old.index.tz_localize(df.index.tz)
+            df = pd.concat([old, df])
+            df = df[~df.index.duplicated(keep="last")].sort_index()
+        except FixtureNotFound:
+            pass
+        self._save(df, "history", symbol, interval)
+
+    def info(self, symbol):
+        return self._save(self.inner.info(symbol), "info", symbol)
+
+    def quote(self, symbol):
+        return self._save(self.inner.quote(symbol), "quote", symbol)
+
+    def options(self, symbol):
+        return self._save(self.inner.options(symbol), "options", symbol)
+
+    def history(self, symbol, period=None, start=None, end=None, interval="1d"):
+        df = self.inner.history(symbol, period=period, start=start, end=end, interval=interval)
+        self._save_history(df, symbol, interval)
+        return df
+
+    def download(self, symbols, period=None, start=None, end=None, interval="1d"):
+        wide = self.inner.download(symbols, period=period, start=start, end=end, interval=interval)
+        if not wide.empty:
+            for sym in wide.columns.get_level_values(1).unique():
+                self._save_history(wide.xs(sym, axis=1, level=1).dropna(how="all"), sym, interval)
+        return wide
+
+    def dividends(self, symbol):
+        return self._save(self.inner.dividends(symbol), "dividends", symbol)
+
+    def calendar(self, symbol):
+        return self._save(self.inner.calendar(symbol), "calendar", symbol)
+
+    def option_chain(self, symbol, expiry):
+        chain = self.inner.option_chain(symbol, expiry)
+        self._save(tuple(chain), "option_chain", symbol, expiry)
+        return chain
+
+
+@functools.lru_cache(maxsize=8)
+def _fake_dates(end):
+    # Business days of every fake history: built once, shared by all symbols
+    return pd.bdate_range(start=FAKE_ORIGIN, end=end, tz="America/New_York")
+
+
+class FakeProvider(MarketDataProvider):
+    """
+    Synthetic, deterministic data for benchmarks: every symbol gets its own
+    seeded random walk. Each call sleeps `latency` seconds and fails with
+    probability `failure_rate`, to mimic a remote API.
+    """
+
+    def __init__(self, latency=0.0, failure_rate=0.0, days=800, end=None):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.days = days
+        self.end = pd.Timestamp(end or datetime.date.today())
+
+    def _call(self, symbol):
+        if self.latency:
+            time.sleep(self.latency)
+        if self.failure_rate and random.random() < self.failure_rate:
+            raise RuntimeError(f"fake failure for {symbol}")
+
+    def _rng(self, symbol, salt=0):
+        return np.random.default_rng([salt] + [ord(c) for c in symbol])
+
+    def _full_history(self, symbol):
+        rng = self._rng(symbol)
+        # The walk starts at a fixed origin, so a given date keeps its price whatever `end` is
+        dates = _fake_dates(self.end)
+        close = 20 + 180 * rng.random() * np.exp(np.cumsum(rng.normal(0.0003, 0.015, len(dates))))
+        spread = close * rng.uniform(0.002, 0.02, len(dates))
+        df = pd.DataFrame({
+            "Open": close + rng.uniform(-0.5, 0.5, len(dates)) * spread,
+            "High": close + spread,
+            "Low": close - spread,
+            "Close": close,
+            "Volume": rng.integers(100_000, 10_000_000, len(dates)),
+            "Dividends": 0.0,
+            "Stock Splits": 0.0,
+        }, index=dates.rename("Date"))
+        return df.iloc[-self.days:]
+
+    def info(self, symbol):
+        self._call(symbol)
+        return self._info(symbol)
+
+    def _info(self, symbol):
+        rng = self._rng(symbol, 1)
+        sectors = ["Technology", "Financial Services", "Healthcare", "Energy", "Industrials",
+                   "Consumer Defensive", "Consumer Cyclical", "Utilities", "Basic Materials",
+                   "Real Estate", "Communication Services"]
+        return {
+            "symbol": symbol,
+            "longName": f"{symbol} Inc.",
+            "sector": sectors[rng.integers(len(sectors))],
+            "industry": "Synthetic",
+            "country": "United States",
+            "marketCap": float(10 ** rng.uniform(7, 12.5)),
+            "currency": "USD",
+            "quoteType": "EQUITY",
+            "exchange": "NMS",
+        }
+
+    def quote(self, symbol):
+        self._call(symbol)
+        info = self._info(symbol)
+        return {
+            "symbol": symbol,
+            "marketCap": info["marketCap"],
+            "quoteType": info["quoteType"],
+            "currency": info["currency"],
+            "lastPrice": float(self._full_history(symbol)["Close"].iloc[-1]),
+        }
+
+    def options(self, symbol):
+        self._call(symbol)
+        first = self.end + pd.offsets.Week(weekday=4)
+        return tuple((first + pd.DateOffset(weeks=4 * i)).date().isoformat() for i in range(6))
+
+    def history(self, symbol, period=None, start=None, end=None, interval="1d"):
+        self._call(symbol)
+        if period is None and start is None:
+            period = "1mo"
+        return slice_history(self._full_history(symbol), period, start, end)
+
+    def download(self, symbols, period=None, start=None, end=None, interval="1d"):
+        self._call(",".join(symbols))
+        frames = {
+            sym: slice_history(self._full_history(sym), period or ("1mo" if start is None else None), start, end)
+            .drop(columns=["Dividends", "Stock Splits"])
+            for sym in symbols
+        }
+        return to_wide(frames)
+
+    def dividends(self, symbol):
+        self._call(symbol)
+        rng = self._rng(symbol, 2)
+        if rng.random() < 0.4:
+            return pd.Series(dtype=float, name="Dividends")
+        dates = pd.date_range(end=self.end, periods=8, freq="QS", tz="America/New_York")
+        return pd.Series(rng.uniform(0.1, 1.0), index=dates.rename("Date"), name="Dividends")
+
+    def calendar(self, symbol):
+        self._call(symbol)
+        rng = self._rng(symbol, 3)
+        return {"Ex-Dividend Date": (self.end + pd.Timedelta(days=int(rng.integers(1, 90)))).date()}
+
+    def option_chain(self, symbol, expiry):
+        self._call(symbol)
+        rng = self._rng(symbol, 4)
+        spot = float(self._full_history(symbol)["Close"].iloc[-1])
+        strikes = np.round(np.arange(0.5, 1.5, 0.025) * spot)
+        strikes = np.unique(strikes[strikes > 0])
+        days = max(1, (pd.Timestamp(expiry) - self.end).days)
+
+        def side(is_call):
+            intrinsic = np.maximum(spot - strikes, 0) if is_call else np.maximum(strikes - spot, 0)
+            mid = intrinsic + spot * 0.3 * np.sqrt(days / 365) * 0.4 * np.exp(-((strikes / spot - 1) ** 2) * 20)
+            half = np.maximum(0.01, mid * rng.uniform(0.005, 0.05, len(strikes)))
+            return pd.DataFrame({
+                "contractSymbol": [f"{symbol}{expiry.replace('-', '')}{'C' if is_call else 'P'}{int(k * 1000):08d}" for k in strikes],
+                "strike": strikes,
+                "lastPrice": mid.round(2),
+                "bid": (mid - half).clip(min=0).round(2),
+                "ask": (mid + half).round(2),
+                "volume": rng.integers(0, 5_000, len(strikes)),
+                "openInterest": rng.integers(0, 50_000, len(strikes)),
+                "impliedVolatility": rng.uniform(0.15, 0.6, len(strikes)),
+            })
+
+        return OptionChain(side(True), side(False))
+
+
+class InstrumentedProvider(MarketDataProvider):
+    """
+    Forwards every call to `inner`, counting the calls, failures and time
+    of each endpoint in the run report (see instrumentation.py).
+    """
+
+    def __init__(self, inner):
+        self.inner = inner
+
+    def _call(self, endpoint, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            result = getattr(self.inner, endpoint)(*args, **kwargs)
+        except Exception:
+            instrumentation.record_call(endpoint, time.perf_counter() - start, failed=True)
+            raise
+        instrumentation.record_call(endpoint, time.perf_counter() - start)
+        return result
+
+    def info(self, symbol):
+        return self._call("info", symbol)
+
+    def quote(self, symbol):
+        return self._call("quote", symbol)
+
+    def options(self, symbol):
+        return self._call("options", symbol)
+
+    def history(self, symbol, period=None, start=None, end=None, interval="1d"):
+        return self._call("history", symbol, period=period, start=start, end=end, interval=interval)
+
+    def download(self, symbols, period=None, start=None, end=None, interval="1d"):
+        return self._call("download", symbols, period=period, start=start, end=end, interval=interval)
+
+    def dividends(self, symbol):
+        return self._call("dividends", symbol)
+
+    def calendar(self, symbol):
+        return self._call("calendar", symbol)
+
+    def option_chain(self, symbol, expiry):
+        return self._call("option_chain", symbol, expiry)
+
+
+_provider = None
+
+
+def get_provider():
+    """
+    Process-wide provider, chosen with the TICKERS_PROVIDER environment variable:
+    yfinance (default), record, replay or fake. Fixtures live in TICKERS_FIXTURES.
+    Its calls are counted in the run report.
+    """
+    global _provider
+    if _provider is None:
+        kind = os.environ.get(PROVIDER_ENV, "yfinance")
+        fixtures_dir = os.environ.get(FIXTURES_ENV, FIXTURES_DIR)
+        if kind == "yfinance":
+            _provider = YFinanceProvider()
+        elif kind == "record":
+            _provider = RecordingProvider(fixtures_dir=fixtures_dir)
+        elif kind == "replay":
+            _provider = ReplayProvider(fixtures_dir)
+        elif kind == "fake":
+            _provider = FakeProvider()
+        else:
+            raise ValueError(f"Unknown {PROVIDER_ENV} '{kind}'")
+        _provider = InstrumentedProvider(_provider)
+    return _provider
+
+
+def set_provider(provider):
+    global _provider
+    if provider is not None and not isinstance(provider, InstrumentedProvider):
+        provider = InstrumentedProvider(provider)
+    _provider = provider
@@ -0,0 +1,167 @@
+import db
+
+DB_PATH = "data/tickers.db"
+
+
+def _columns(conn, table):
+    return [row[1] for row in conn.execute(f'PRAGMA table_info("{table}")')]
+
+
+def _add_columns(conn, table, columns):
+    existing = _columns(conn, table)
+    for col, col_type in columns.items():
+        if col not in existing:
+            conn.execute(f'ALTER TABLE "{table}" ADD COLUMN "{col}" {col_type}')
+
+
+def _rebuild_with_primary_key(conn, table, key):
+    """
+    SQLite can't add a primary key in place: the table is copied into a new
+    one keyed on `key`, with its current columns. For duplicated keys, the
+    last inserted row wins.
+    """
+    info = conn.execute(f'PRAGMA table_info("{table}")').fetchall()
+    if any(row[1] == key and row[5] for row in info):
+        return  # Already the primary key
+    columns = ", ".join(
+        f'"{name}" {col_type}' + (f" DEFAULT {default}" if default is not None else "")
+        for _, name, col_type, _, default, _ in info
+    )
+    names = ", ".join(f'"{row[1]}"' for row in info)
+    conn.execute(f'CREATE TABLE "{table}_new" ({columns}, PRIMARY KEY ("{key}"))')
+    conn.execute(f'INSERT OR REPLACE INTO "{table}_new" ({names}) SELECT {names} FROM "{table}" ORDER BY rowid')
+    conn.execute(f'DROP TABLE "{table}"')
+    conn.execute(f'ALTER TABLE "{table}_new" RENAME TO "{table}"')
+
+
+def _v1_base_schema(conn):
+    # Tables and columns formerly added by 02's alter_* helpers and by the scripts
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS us_tickers (
+            "Symbol" TEXT,
+            "Security Name" TEXT,
+            "Exchange" TEXT
+        )
+    """)
+    _add_columns(conn, "us_tickers", {"processed": "INTEGER DEFAULT 0"})
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS ticker_info (
+            symbol TEXT,
+            longName TEXT,
+            sector TEXT,
+            industry TEXT,
+            country TEXT,
+            marketCap REAL,
+            currency TEXT,
+            isOptionable INTEGER,
+            quoteType TEXT,
+            exchange TEXT
+        )
+    """)
+    _add_columns(conn, "ticker_info", {
+        "has_dividend": "BOOLEAN",
+        "next_dividend_date": "TEXT",
+        "days_until_dividend": "INTEGER",
+        "last_dividend_check": "TEXT",
+    })
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS price_cache (
+            symbol TEXT,
+            period TEXT,
+            return_pct REAL,
+            last_updated TEXT,
+            PRIMARY KEY (symbol, period, last_updated)
+        )
+    """)
+    _add_columns(conn, "price_cache", {"close_price": "REAL", "fetched_at": "REAL"})
+
+
+def _v2_primary_keys(conn):
+    _rebuild_with_primary_key(conn, "us_tickers", "Symbol")
+    _rebuild_with_primary_key(conn, "ticker_info", "symbol")
+
+
+def _v3_indexes(conn):
+    # Covers list_large_optionable_tickers(): equality on isOptionable, range
+    # and order on marketCap, selected columns read from the index
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_ticker_info_optionable_cap
+        ON ticker_info (isOptionable, marketCap, symbol, sector, industry, exchange, longName)
+    """)
+    # Lets dividends.stale_dividend_symbols() skip the symbols checked today
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_ticker_info_last_dividend_check ON ticker_info (last_dividend_check)")
+    # Unprocessed symbols of enrich_tickers()
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_us_tickers_processed ON us_tickers (processed)")
+
+
+def _v4_listing_dates(conn):
+    # Set by 01's diff of the listing files: delisted symbols stay, flagged
+    _add_columns(conn, "us_tickers", {"listed_at": "TEXT", "delisted_at": "TEXT"})
+
+
+def _v5_listing_metadata(conn):
+    # Listing flags kept by 01, and the reason of its pre-filter (NULL: kept)
+    _add_columns(conn, "us_tickers", {
+        "Market Category": "TEXT",
+        "Test Issue": "TEXT",
+        "Financial Status": "TEXT",
+        "ETF": "TEXT",
+        "exclude_reason": "TEXT",
+    })
+
+
+def _v6_enrichment_phases(conn):
+    # Fetch times of the quote pass and of the full info pass of 02. Rows
+    # fully enriched before the two phases get 0: done, at an unknown time.
+    _add_columns(conn, "ticker_info", {"quoted_at": "REAL", "enriched_at": "REAL"})
+    conn.execute("UPDATE ticker_info SET enriched_at = 0 WHERE enriched_at IS NULL AND isOptionable IS NOT NULL")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_ticker_info_enriched ON ticker_info (enriched_at, marketCap)")
+
+
+def _v7_fetched_at(conn):
+    # Last fetch of any kind, the staleness used by 02's refresh scheduler
+    _add_columns(conn, "ticker_info", {"fetched_at": "REAL"})
+    conn.execute("UPDATE ticker_info SET fetched_at = MAX(COALESCE(quoted_at, 0), COALESCE(enriched_at, 0))")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_ticker_info_fetched_at ON ticker_info (fetched_at)")
+
+
+# Append only: the schema version of a DB (PRAGMA user_version) is the
+# number of migrations applied to it
+MIGRATIONS = [
+    _v1_base_schema,
+    _v2_primary_keys,
+    _v3_indexes,
+    _v4_listing_dates,
+    _v5_listing_metadata,
+    _v6_enrichment_phases,
+    _v7_fetched_at,
+]
+
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn):
+    """
+    Brings the schema of tickers.db up to date. Each pending migration runs
+    in its own transaction, together with the version bump.
+
+    Returns:
+        the schema version
+    """
+    version = schema_version(conn)
+    for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+        with db.transaction(conn):
+            migration(conn)
+            conn.execute(f"PRAGMA user_version = {number}")
+        print(f"✅ Schema migrated to version {number} ({migration.__name__})")
+    return len(MIGRATIONS)
+
+
+if __name__ == "__main__":
+    conn = db.connect(DB_PATH)
+    try:
+        migrate(conn)
+    finally:
+        conn.close()
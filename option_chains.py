@@ -0,0 +1,127 @@
+import time
+import datetime
+import threading
+import numpy as np
+import pandas as pd
+import instrumentation
+from market_data import get_provider
+from market_cache import is_market_open, last_completed_session
+
+SNAPSHOT_SECONDS = 15 * 60  # Length of a snapshot while the market is open
+
+SPREAD_COLUMNS = ["strike", "bid", "ask", "mid", "spread", "spread_pct", "openInterest", "volume"]
+
+
+def snapshot_time(now=None):
+    """
+    Snapshot a chain fetched at `now` belongs to: a SNAPSHOT_SECONDS slot
+    while the market is open, else the last completed session, whose
+    quotes no longer change.
+    """
+    now = time.time() if now is None else now
+    when = datetime.datetime.fromtimestamp(now, tz=datetime.timezone.utc)
+    if is_market_open(when):
+        return int(now // SNAPSHOT_SECONDS) * SNAPSHOT_SECONDS
+    return last_completed_session(when).isoformat()
+
+
+class ChainCache:
+    """
+    In-memory option chains keyed by (ticker, expiry, snapshot time). Within
+    a snapshot, every query on a chain is served without a new download;
+    a newer snapshot replaces the older one. Thread-safe.
+    """
+
+    def __init__(self, provider=None):
+        self.provider = provider
+        self.chains = {}  # (ticker, expiry) -> (snapshot, OptionChain)
+        self.expiries = {}  # ticker -> (snapshot, expiries)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _provider(self):
+        return self.provider or get_provider()
+
+    def _cached(self, store, key, fetch, now=None):
+        snapshot = snapshot_time(now)
+        with self.lock:
+            entry = store.get(key)
+            if entry is not None and entry[0] == snapshot:
+                self.hits += 1
+                instrumentation.record_cache("option_chains", hits=1)
+                return entry[1]
+            self.misses += 1
+        instrumentation.record_cache("option_chains", misses=1)
+        value = fetch()
+        with self.lock:
+            store[key] = (snapshot, value)
+        return value
+
+    def options(self, ticker, now=None):
+        # Expiry dates of `ticker`, nearest first
+        return self._cached(self.expiries, ticker, lambda: tuple(self._provider().options(ticker)), now)
+
+    def chain(self, ticker, expiry=None, now=None):
+        if expiry is None:
+            expiry = self.options(ticker, now)[0]  # default: nearest expiry
+        return self._cached(self.chains, (ticker, expiry), lambda: self._provider().option_chain(ticker, expiry), now)
+
+    def clear(self):
+        with self.lock:
+            self.chains.clear()
+            self.expiries.clear()
+
+
+_cache = ChainCache()
+
+
+def get_chain_cache():
+    return _cache
+
+
+def spread_frame(options, strikes=None):
+    """
+    Bid, ask, mid, spread and spread % of mid for every row of an option
+    side (calls or puts), computed on whole columns. With `strikes`, one
+    row per requested strike, in order, NaN where the chain has none.
+    """
+    df = options.drop_duplicates(subset="strike").set_index("strike")
+    if strikes is not None:
+        df = df.reindex(np.asarray(strikes, dtype=float))
+    bid = df["bid"].to_numpy(dtype=float)
+    ask = df["ask"].to_numpy(dtype=float)
+    mid = (bid + ask) / 2
+    spread = ask - bid
+    with np.errstate(divide="ignore", invalid="ignore"):
+        spread_pct = np.where(mid > 0, spread / mid * 100, np.nan)
+    out = pd.DataFrame({
+        "strike": df.index.to_numpy(dtype=float),
+        "bid": bid,
+        "ask": ask,
+        "mid": mid,
+        "spread": spread.round(2),
+        "spread_pct": spread_pct.round(2),
+    })
+    for col in ("openInterest", "volume"):
+        out[col] = df[col].to_numpy() if col in df.columns else np.nan
+    return out[SPREAD_COLUMNS]
+
+
+def option_spreads(ticker, expiry=None, strikes=None, call=True, cache=None):
+    """
+    Spreads of every strike of `ticker` for `expiry` (default: nearest),
+    or only of `strikes`, from the cached chain snapshot.
+
+    Returns:
+        DataFrame with SPREAD_COLUMNS, plus ticker, type and expiry
+    """
+    cache = cache or _cache
+    if expiry is None:
+        expiry = cache.options(ticker)[0]
+    chain = cache.chain(ticker, expiry)
+    out = spread_frame(chain.calls if call else chain.puts, strikes)
+    out.insert(0, "expiry", expiry)
+    out.insert(0, "type", "call" if call else "put")
+    out.insert(0, "ticker", ticker)
+    return out
@@ -0,0 +1,230 @@
+import time
+import numpy as np
+import pandas as pd
+from market_cache import MARKET_TZ, MARKET_CLOSE
+from option_chains import get_chain_cache, spread_frame
+
+RISK_FREE_RATE = 0.04  # Annual, continuously compounded
+YEAR_SECONDS = 365 * 24 * 3600
+
+VOL_MIN = 1e-4  # Bracket of the implied volatility solver
+VOL_MAX = 5.0
+VOL_TOLERANCE = 1e-6  # Solver stops when the volatility is known within this
+MAX_ITERATIONS = 100
+MIN_TIME_VALUE = 0.01  # One tick: below it, the price does not determine the volatility
+
+GREEK_COLUMNS = ["iv", "delta", "gamma", "vega", "theta", "rho"]
+
+
+def norm_pdf(x):
+    return np.exp(-0.5 * np.square(x)) / np.sqrt(2 * np.pi)
+
+
+# Rational approximations of erf and erfc from Cephes (ndtr.c), accurate
+# to double precision: the solver compares prices far below 1e-7
+_ERF_T = [9.60497373987051638749E0, 9.00260197203842689217E1, 2.23200534594684319226E3,
+          7.00332514112805075473E3, 5.55923013010394962768E4]
+_ERF_U = [1.0, 3.35617141647503099647E1, 5.21357949780152679795E2, 4.59432382970980127987E3,
+          2.26290000613890934246E4, 4.92673942608635921086E4]
+_ERFC_P = [2.46196981473530512524E-10, 5.64189564831068821977E-1, 7.46321056442269912687E0,
+           4.86371970985681366614E1, 1.96520832956077098242E2, 5.26445194995477358631E2,
+           9.34528527171957607540E2, 1.02755188689515710272E3, 5.57535335369399327526E2]
+_ERFC_Q = [1.0, 1.32281951154744992508E1, 8.67072140885989742329E1, 3.54937778887819891062E2,
+           9.75708501743205489753E2, 1.82390916687909736289E3, 2.24633760818710981792E3,
+           1.65666309194161350182E3, 5.57535340817727675546E2]
+_ERFC_R = [5.64189583547755073984E-1, 1.27536670759978104416E0, 5.01905042251180477414E0,
+           6.16021097993053585195E0, 7.40974269950448939160E0, 2.97886665372100240670E0]
+_ERFC_S = [1.0, 2.26052863220117276590E0, 9.39603524938001434673E0, 1.20489539808096656605E1,
+           1.70814450747565897222E1, 9.60896809063285878198E0, 3.36907645100081516050E0]
+
+
+def norm_cdf(x):
+    # Standard normal CDF, on whole arrays
+    x = np.asarray(x, dtype=float) / np.sqrt(2)
+    z = np.abs(x)
+    with np.errstate(over="ignore", under="ignore", invalid="ignore"):
+        # |x| < 1/sqrt(2): from erf
+        zz = z * z
+        small = 0.5 + 0.5 * x * np.polyval(_ERF_T, zz) / np.polyval(_ERF_U, zz)
+        # Elsewhere: from erfc of |x|, P/Q up to 8, R/S beyond
+        tail = np.where(
+            z < 8,
+            np.polyval(_ERFC_P, z) / np.polyval(_ERFC_Q, z),
+            np.polyval(_ERFC_R, z) / np.polyval(_ERFC_S, z),
+        ) * np.exp(-zz) * 0.5
+        tail = np.where(x > 0, 1 - tail, tail)
+    return np.where(z < np.sqrt(0.5), small, tail)
+
+
+def _d1_d2(spot, strike, t, rate, vol, dividend_yield):
+    with np.errstate(divide="ignore", invalid="ignore"):
+        vol_t = vol * np.sqrt(t)
+        d1 = (np.log(spot / strike) + (rate - dividend_yield + 0.5 * vol * vol) * t) / vol_t
+    return d1, d1 - vol_t
+
+
+def bs_price(spot, strike, t, vol, call=True, rate=RISK_FREE_RATE, dividend_yield=0.0):
+    """
+    Black-Scholes price of European options. Every parameter is a scalar or
+    an array, broadcast together.
+
+    Params:
+        spot, strike : underlying price, strike
+        t            : time to expiry, in years
+        vol          : annual volatility
+        call         : True for calls, False for puts (or a boolean array)
+    """
+    d1, d2 = _d1_d2(spot, strike, t, rate, vol, dividend_yield)
+    spot_pv = spot * np.exp(-dividend_yield * t)
+    strike_pv = strike * np.exp(-rate * t)
+    call_price = spot_pv * norm_cdf(d1) - strike_pv * norm_cdf(d2)
+    # Put-call parity
+    return np.where(call, call_price, call_price - spot_pv + strike_pv)
+
+
+def bs_greeks(spot, strike, t, vol, call=True, rate=RISK_FREE_RATE, dividend_yield=0.0):
+    """
+    Black-Scholes greeks, on whole arrays (see bs_price()).
+
+    Returns:
+        dict of arrays: delta, gamma, vega (per 1 vol point), theta (per
+        calendar day), rho (per 1% of rate)
+    """
+    d1, d2 = _d1_d2(spot, strike, t, rate, vol, dividend_yield)
+    growth = np.exp(-dividend_yield * t)
+    discount = np.exp(-rate * t)
+    pdf = norm_pdf(d1)
+    sign = np.where(call, 1.0, -1.0)
+    cdf1 = norm_cdf(sign * d1)
+    cdf2 = norm_cdf(sign * d2)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sqrt_t = np.sqrt(t)
+        gamma = growth * pdf / (spot * vol * sqrt_t)
+        theta = (
+            -spot * growth * pdf * vol / (2 * sqrt_t)
+            + sign * (dividend_yield * spot * growth * cdf1 - rate * strike * discount * cdf2)
+        )
+    return {
+        "delta": sign * growth * cdf1,
+        "gamma": gamma,
+        "vega": spot * growth * pdf * sqrt_t / 100,
+        "theta": theta / 365,
+        "rho": sign * strike * t * discount * cdf2 / 100,
+    }
+
+
+def implied_volatility(price, spot, strike, t, call=True, rate=RISK_FREE_RATE, dividend_yield=0.0,
+                       tol=VOL_TOLERANCE, max_iter=MAX_ITERATIONS, min_time_value=MIN_TIME_VALUE):
+    """
+    Implied volatility of every option at once: a vectorized Newton solver,
+    safeguarded by bisection. Each option keeps a [low, high] bracket of
+    its root; a Newton step that leaves it (or a vanishing vega) is
+    replaced by the bracket midpoint, so every option converges. An option
+    is solved when its volatility is known within `tol`: its Newton step
+    (price error / vega) or its bracket is smaller than that.
+
+    Options whose time value (price above the discounted intrinsic value)
+    is below `min_time_value`, one tick, get NaN: every volatility from
+    near zero up to a large one rounds to the same quoted price, so the
+    price does not determine it. This covers far out-of-the-money and deep
+    in-the-money contracts close to expiry, and unquoted ones (mid 0).
+
+    Returns:
+        array of volatilities, NaN where the time value is below one tick,
+        the price is above the no-arbitrage bound, the time to expiry is not
+        positive or the solver did not converge
+    """
+    price, spot, strike, t, call = (
+        np.array(a, dtype=dtype) for a, dtype in zip(
+            np.broadcast_arrays(price, spot, strike, t, call), (float, float, float, float, bool)
+        )
+    )
+    spot_pv = spot * np.exp(-dividend_yield * t)
+    strike_pv = strike * np.exp(-rate * t)
+    lower = np.where(call, np.maximum(spot_pv - strike_pv, 0), np.maximum(strike_pv - spot_pv, 0))
+    upper = np.where(call, spot_pv, strike_pv)
+    with np.errstate(invalid="ignore"):
+        valid = (price - lower >= min_time_value) & (price < upper) & (t > 0) & (strike > 0) & (spot > 0)
+
+    flat = np.full(price.size, np.nan)
+    idx = np.flatnonzero(valid)
+    p, s, k, tt, c = (a.ravel()[idx] for a in (price, spot, strike, t, call))
+    low = np.full(len(idx), VOL_MIN)
+    high = np.full(len(idx), VOL_MAX)
+    v = np.clip(np.sqrt(2 * np.pi / tt) * p / s, 0.05, 1.0)  # Brenner-Subrahmanyam guess
+
+    for _ in range(max_iter):
+        if not len(idx):
+            break
+        diff = bs_price(s, k, tt, v, c, rate, dividend_yield) - p
+        # The price increases with the volatility: shrink the bracket
+        high = np.where(diff > 0, v, high)
+        low = np.where(diff < 0, v, low)
+        vega = bs_greeks(s, k, tt, v, c, rate, dividend_yield)["vega"] * 100
+        with np.errstate(all="ignore"):
+            step = v - diff / vega
+        newton = (vega > 0) & (step > low) & (step < high)
+        done = (newton & (np.abs(step - v) < tol)) | (diff == 0) | (high - low < tol)
+        flat[idx[done]] = np.where(newton, step, v)[done]
+        v = np.where(newton, step, (low + high) / 2)
+        keep = ~done
+        idx, p, s, k, tt, c, v, low, high = (a[keep] for a in (idx, p, s, k, tt, c, v, low, high))
+    return flat.reshape(price.shape)
+
+
+def years_to_expiry(expiry, now=None):
+    # Expiries settle at the market close of their date
+    now = time.time() if now is None else now
+    close = pd.to_datetime(pd.Series(expiry)) + pd.Timedelta(hours=MARKET_CLOSE.hour, minutes=MARKET_CLOSE.minute)
+    epoch = (close.dt.tz_localize(MARKET_TZ) - pd.Timestamp(0, tz="UTC")).dt.total_seconds()
+    return (epoch.to_numpy(dtype=float) - now) / YEAR_SECONDS
+
+
+def chain_greeks(chains, spots, now=None, rate=RISK_FREE_RATE, dividend_yields=None):
+    """
+    Implied volatility and greeks of every contract of `chains`, priced at
+    the mid (bid/ask), in one vectorized pass whatever the number of
+    tickers and expiries. Options are treated as European.
+
+    Params:
+        chains          : frame with symbol, expiry, type ("call"/"put"), strike, mid
+                          — e.g. spread_frame() rows of several chains
+        spots           : Series symbol -> underlying price
+        dividend_yields : optional Series symbol -> continuous dividend yield
+
+    Returns:
+        `chains` with spot, t (years) and GREEK_COLUMNS added
+    """
+    df = chains.copy()
+    df["spot"] = df["symbol"].map(spots).astype(float)
+    df["t"] = years_to_expiry(df["expiry"], now) if len(df) else np.array([], dtype=float)
+    q = df["symbol"].map(dividend_yields).fillna(0.0).to_numpy(dtype=float) if dividend_yields is not None else 0.0
+    args = (df["spot"].to_numpy(dtype=float), df["strike"].to_numpy(dtype=float), df["t"].to_numpy(dtype=float))
+    call = (df["type"] == "call").to_numpy()
+
+    df["iv"] = implied_volatility(df["mid"].to_numpy(dtype=float), *args, call, rate, q)
+    for name, values in bs_greeks(*args, df["iv"].to_numpy(), call, rate, q).items():
+        df[name] = values
+    return df
+
+
+def option_greeks(ticker, spot, expiry=None, now=None, rate=RISK_FREE_RATE, cache=None):
+    """
+    IV and greeks of the calls and puts of `ticker` for `expiry` (default:
+    nearest; "all" for every listed expiry), from the cached chain snapshots.
+    """
+    cache = cache or get_chain_cache()
+    if expiry == "all":
+        expiries = cache.options(ticker, now)
+    else:
+        expiries = [expiry or cache.options(ticker, now)[0]]
+    frames = []
+    for exp in expiries:
+        chain = cache.chain(ticker, exp, now)
+        for kind, side in (("call", chain.calls), ("put", chain.puts)):
+            df = spread_frame(side)
+            df.insert(0, "type", kind)
+            df.insert(0, "expiry", exp)
+            df.insert(0, "symbol", ticker)
+            frames.append(df)
+    return chain_greeks(pd.concat(frames, ignore_index=True), pd.Series({ticker: spot}), now, rate)
@@ -0,0 +1,163 @@
+import datetime
+import numpy as np
+import pandas as pd
+from market_data import get_provider
+from market_cache import daily_closes
+
+PERIODS = {
+    "Perf Week": 7,
+    "Perf Month": 30,
+    "Perf Quart": 90,
+    "Perf Half": 180,
+    "Perf Year": 365,
+}
+CHUNK_SIZE = 200  # Tickers per multi-symbol download
+
+
+def download_closes(tickers, start, chunk_size=CHUNK_SIZE, provider=None):
+    """
+    Close prices of all `tickers` since `start`, as one wide frame
+    (dates x tickers), fetched with one multi-symbol request per chunk.
+    """
+    provider = provider or get_provider()
+    frames = []
+    for i in range(0, len(tickers), chunk_size):
+        chunk = tickers[i:i + chunk_size]
+        try:
+            wide = provider.download(chunk, start=start)
+        except Exception as e:
+            print(f"⚠️ Error fetching data for {', '.join(chunk)}: {e}")
+            continue
+        if not wide.empty:
+            frames.append(wide["Close"])
+    if not frames:
+        return pd.DataFrame()
+    closes = pd.concat(frames, axis=1)
+    if closes.index.tz is not None:
+        closes.index = closes.index.tz_localize(None)
+    return closes.sort_index()
+
+
+def fill_forward(closes):
+    # Last valid value on or before each row, column by column (NaN before the first one)
+    n = closes.shape[0]
+    idx = np.where(~np.isnan(closes), np.arange(n)[:, None], 0)
+    np.maximum.accumulate(idx, axis=0, out=idx)
+    # Rows before the first valid value point at row 0, which is NaN there too
+    return np.take_along_axis(closes, idx, axis=0)
+
+
+def fill_backward(closes):
+    return fill_forward(closes[::-1])[::-1]
+
+
+def period_returns(dates, closes, anchors, since=None):
+    """
+    Percent returns of the latest close vs. the close at each anchor date,
+    for every column of `closes` in one pass.
+
+    Params:
+        dates   : sorted datetime64 array (n,)
+        closes  : float array (n, k) — one column per ticker, NaN for missing bars
+        anchors : datetime64 array (m,) — last close on or before each anchor is used
+        since   : datetime64 — optional, first close on or after it is used (e.g. YTD)
+
+    Returns:
+        float array (k, m), plus one last column when `since` is given
+    """
+    closes = np.asarray(closes, dtype=np.float64)
+    filled = fill_forward(closes)
+    latest = filled[-1]
+
+    pos = np.searchsorted(dates, anchors, side="right") - 1
+    past = filled[np.clip(pos, 0, None)]
+    past[pos < 0] = np.nan
+    bases = [past]
+
+    if since is not None:
+        first = np.searchsorted(dates, np.asarray([since], dtype=dates.dtype), side="left")[0]
+        if first < len(dates):
+            bases.append(fill_backward(closes[first:])[:1])
+        else:
+            bases.append(np.full((1, closes.shape[1]), np.nan))
+
+    base = np.vstack(bases)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return ((latest - base) / base * 100).T
+
+
+def get_performance_table(tickers, batch=True, chunk_size=CHUNK_SIZE, provider=None, periods=PERIODS, use_cache=True):
+    """
+    Week/Month/Quarter/Half/Year/YTD returns (%) of every ticker.
+    With use_cache, closes come from the shared daily bars (history store),
+    refreshed incrementally; otherwise they are downloaded in batches.
+    """
+    if not batch:
+        return get_performance_table_sequential(tickers, provider=provider)
+
+    today = datetime.datetime.today()
+    start_ytd = datetime.datetime(today.year, 1, 1)
+
+    lookback = max([370] + [days + 5 for days in periods.values()])
+    start = start_ytd - datetime.timedelta(days=lookback)
+    if use_cache and provider is None:
+        closes = daily_closes(list(tickers), start=start)
+    else:
+        closes = download_closes(list(tickers), start, chunk_size, provider)
+    if closes.empty:
+        return pd.DataFrame()
+    closes = closes[[t for t in tickers if t in closes.columns and closes[t].notna().any()]]
+
+    anchors = np.array([today - datetime.timedelta(days=days) for days in periods.values()], dtype="datetime64[ns]")
+    returns = period_returns(
+        closes.index.values.astype("datetime64[ns]"), closes.to_numpy(dtype=np.float64),
+        anchors, since=np.datetime64(start_ytd, "ns"),
+    )
+
+    table = pd.DataFrame(returns.round(2), columns=list(periods) + ["Perf YTD"])
+    table.insert(0, "Ticker", closes.columns)
+    return table
+
+
+def get_performance_table_sequential(tickers, provider=None):
+    # One history request per ticker: kept for comparison with the batched mode
+    provider = provider or get_provider()
+    today = datetime.datetime.today()
+    start_ytd = datetime.datetime(today.year, 1, 1)
+
+    results = []
+
+    for ticker in tickers:
+        try:
+            data = provider.history(ticker, start=start_ytd - datetime.timedelta(days=370))
+            if data.empty:
+                continue
+
+            latest_close = data["Close"].iloc[-1]
+            row = {"Ticker": ticker}
+
+            # Compute percent changes
+            data.index = data.index.tz_localize(None)  # ← This removes timezone info
+            for label, days in PERIODS.items():
+                past_date = today - datetime.timedelta(days=days)
+                past_prices = data[data.index <= past_date]
+                if not past_prices.empty:
+                    past_close = past_prices["Close"].iloc[-1]
+                    row[label] = round((latest_close - past_close) / past_close * 100, 2)
+                else:
+                    row[label] = None
+
+            # Year-to-date
+            ytd_data = data[data.index >= start_ytd]
+            if not ytd_data.empty:
+                ytd_start = ytd_data["Close"].iloc[0]
+                row["Perf YTD"] = round((latest_close - ytd_start) / ytd_start * 100, 2)
+            else:
+                row["Perf YTD"] = None
+
+            results.append(row)
+
+        except Exception as e:
+            print(f"⚠️ Error fetching data for {ticker}: {e}")
+
+    return pd.DataFrame(results)
@@ -0,0 +1,80 @@
+import datetime
+import pandas as pd
+from market_data import period_start
+
+SCREEN_COLUMNS = [
+    "symbol", "sector", "sector_etf", "return_pct", "sector_etf_pct",
+    "outperforming", "has_dividend", "days_until_dividend"
+]
+
+
+def period_return_table(closes, periods):
+    """
+    Return (fraction) of every column of `closes` over each yfinance-style
+    period, from the first to the last close inside the window.
+
+    Returns:
+        frame indexed like closes.columns, one column per period
+    """
+    if closes.empty:
+        return pd.DataFrame(index=closes.columns, columns=list(periods), dtype=float)
+    last = closes.ffill().iloc[-1]
+    table = {}
+    for period in periods:
+        first_date = period_start(period, closes.index[-1])
+        window = closes if first_date is None else closes[closes.index > first_date]
+        first = window.bfill().iloc[0]
+        counts = window.notna().sum()
+        table[period] = ((last - first) / first).where(counts >= 2)
+    return pd.DataFrame(table)
+
+
+def screen_candidates(frame, etf_returns, period="6mo", min_market_cap=None, max_price=120,
+                      require_outperforming=False, require_dividend=False):
+    """
+    Applies the candidate filters as column expressions, without any fetch:
+    call it again with other thresholds to sweep them.
+
+    Params:
+        frame         : one row per symbol — symbol, sector, marketCap, price,
+                        has_dividend, days_until_dividend, and one return column per period
+        etf_returns   : sector, sector_etf and one return column per period
+        period        : str   — return period to compare, e.g. "6mo"
+        min_market_cap: float — e.g. 100_000_000_000, None to keep all
+        max_price     : float — last price ceiling, None to keep all
+        require_outperforming, require_dividend : bool — extra filters
+
+    Returns:
+        the candidates table, sorted by return
+    """
+    etf = etf_returns[["sector", "sector_etf", period]].rename(columns={period: "etf_ret"})
+    df = frame.rename(columns={period: "ticker_ret"}).merge(etf, on="sector", how="left")
+    # All-None returns (e.g. ETF bars not fetched) come as object columns
+    df[["ticker_ret", "etf_ret"]] = df[["ticker_ret", "etf_ret"]].astype(float)
+
+    keep = df["ticker_ret"].notna() & df["sector_etf"].notna() & df["etf_ret"].notna() & df["price"].notna()
+    if min_market_cap is not None:
+        keep &= df["marketCap"] > min_market_cap
+    if max_price is not None:
+        too_expensive = df["price"] > max_price
+        if (keep & too_expensive).any():
+            print(f"⛔ {(keep & too_expensive).sum()} tickers skipped (last price > {max_price})")
+        keep &= ~too_expensive
+    outperforming = pd.Series(False, index=df.index)
+    outperforming[keep] = df.loc[keep, "ticker_ret"] > df.loc[keep, "etf_ret"]
+    if require_outperforming:
+        keep &= outperforming
+    if require_dividend:
+        keep &= df["has_dividend"].fillna(0).astype(bool)
+
+    missing_etf = df.loc[df["sector_etf"].isna(), "sector"].dropna().unique()
+    for sector in missing_etf:
+        print(f"⚠️ No ETF found for sector '{sector}'")
+
+    out = df[keep].copy()
+    out["return_pct"] = (out["ticker_ret"] * 100).round(2)
+    out["sector_etf_pct"] = (out["etf_ret"] * 100).round(2)
+    out["outperforming"] = outperforming[keep]
+    out = out[SCREEN_COLUMNS].sort_values(by="return_pct", ascending=False).reset_index(drop=True)
+    out["evaluated_at"] = datetime.date.today().isoformat()
+    return out